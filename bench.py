@@ -0,0 +1,950 @@
+import sys
+import time
+from contextlib import contextmanager
+import numpy as np
+from braille import *
+from spatial import GridIndex
+from drawing_utils import mercator_project, mercator_unproject
+from tiles import tile_coords_to_lonlat, raw_cache
+from projection import *
+from geometry import *
+from zoom_policy import TileZoomPolicy
+from prefetch import Prefetcher, tiles_for_view
+import tiles
+from tile_store import TileStore, migrate
+import map_data
+from map_data import TileManager, TileFetcher
+
+# tiny benchmark runner, `python bench.py [name ...] [--json report.json]`,
+# `python bench.py --compare old.json new.json` diffs two reports
+benchmarks = {}
+
+def benchmark(fn):
+    benchmarks[fn.__name__[len("bench_"):]] = fn
+    return fn
+
+def best_of(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+@contextmanager
+def patched(module, **values):
+    # module globals set for the length of a benchmark, put back afterwards
+    # so benchmarks dont depend on which ones ran before them
+    old = {name: getattr(module, name) for name in values}
+    for name, value in values.items(): setattr(module, name, value)
+    try: yield
+    finally:
+        for name, value in old.items(): setattr(module, name, value)
+
+@contextmanager
+def temp_tile_store(tile_url=None):
+    # a throwaway tiles.mbtiles, yields its path. tiles.cache/store, the env
+    # var spawned workers read and tile_processing_version (benchmarks bump
+    # it to miss processed copies) are all put back afterwards
+    import os, tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tiles.mbtiles")
+        old_env = os.environ.get("CARTOASCII_TILE_CACHE")
+        os.environ["CARTOASCII_TILE_CACHE"] = path
+        try:
+            with patched(tiles, cache=path, store=None, tile_url=tile_url or tiles.tile_url), \
+                 patched(map_data, tile_processing_version=map_data.tile_processing_version):
+                try: yield path
+                finally:
+                    if tiles.store is not None: tiles.store.close()
+        finally:
+            if old_env is None: del os.environ["CARTOASCII_TILE_CACHE"]
+            else: os.environ["CARTOASCII_TILE_CACHE"] = old_env
+
+@contextmanager
+def temp_base_caches():
+    # the base layer cache files in a throwaway directory, yields it
+    import os, tempfile
+    with tempfile.TemporaryDirectory() as tmp, patched(
+            map_data, borders_cache=os.path.join(tmp, "cache_borders.json"),
+            cities_cache=os.path.join(tmp, "cache_cities.json"),
+            roads_cache=os.path.join(tmp, "cache_roads.npz"),
+            base_snapshot=os.path.join(tmp, "cache_base.npz")):
+        yield tmp
+
+def synthetic_buildings(n, cam_x, cam_y, span, seed=0):
+    # closed little boxes scattered around the camera
+    rng = np.random.default_rng(seed)
+    polys = []
+    for _ in range(n):
+        x0, y0 = cam_x + rng.uniform(-span, span), cam_y + rng.uniform(-span, span)
+        w, h = rng.uniform(span / 200, span / 50, 2)
+        polys.append(np.array([(x0, y0), (x0 + w, y0), (x0 + w, y0 + h), (x0, y0 + h), (x0, y0)]))
+    return polys
+
+def legacy_draw(buffer, coords, cam_x, cam_y, zoom, aspect_ratio, color, z_index):
+    # the old path: python projection + python bresenham + one numba call per pixel
+    cx, cy = buffer.width // 2, buffer.height // 2
+    pts = [(int((mx - cam_x) * zoom * aspect_ratio * 2 + cx), int(-(my - cam_y) * zoom * 4 + cy))
+           for mx, my in coords]
+    for (x0, y0), (x1, y1) in zip(pts, pts[1:]):
+        dx, dy = abs(x1 - x0), abs(y1 - y0)
+        sx = 1 if x0 < x1 else -1
+        sy = 1 if y0 < y1 else -1
+        err = dx - dy
+        while True:
+            buffer.set_pixel(x0, y0, color, z_index)
+            if x0 == x1 and y0 == y1: break
+            e2 = 2 * err
+            if e2 > -dy:
+                err -= dy
+                x0 += sx
+            if e2 < dx:
+                err += dx
+                y0 += sy
+
+@benchmark
+def bench_polylines():
+    cam_x, cam_y, zoom, aspect = 2.35, 48.85, 1000.0, 2.0
+    buffer = BrailleBuffer(300 * 2, 80 * 4)
+    polys = synthetic_buildings(2000, cam_x, cam_y, 0.05)
+    coords = np.concatenate(polys)
+    offsets = np.zeros(len(polys) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(p) for p in polys])
+
+    def legacy():
+        for p in polys: legacy_draw(buffer, p, cam_x, cam_y, zoom, aspect, 2, 2)
+
+    def per_polyline():
+        for p in polys: buffer.draw_polyline(p, cam_x, cam_y, zoom, aspect, 2, 2)
+
+    def batched():
+        buffer.draw_polylines(coords, offsets, cam_x, cam_y, zoom, aspect, 2, 2)
+
+    # warm up the jit, and make sure both paths agree
+    buffer.clear(); legacy(); ref = buffer.buffer.copy()
+    buffer.clear(); batched()
+    assert np.array_equal(ref, buffer.buffer), "kernel output differs from legacy path"
+    per_polyline()
+
+    return {
+        "legacy per-pixel": best_of(legacy, 3),
+        "per-polyline kernel": best_of(per_polyline),
+        "batched kernel": best_of(batched),
+    }
+
+@benchmark
+def bench_frame():
+    cam_x, cam_y, zoom, aspect = 2.35, 48.85, 1000.0, 2.0
+    buffer = BrailleBuffer(300 * 2, 80 * 4)
+    for i, p in enumerate(synthetic_buildings(2000, cam_x, cam_y, 0.05)):
+        buffer.draw_polyline(p, cam_x, cam_y, zoom, aspect, 2 + i % 4, 2)
+    buffer.frame()
+    return {"encode 300x80": best_of(buffer.frame, 20)}
+
+@benchmark
+def bench_cull():
+    # ~ne_10m roads sized layer, small viewport
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(-180, 180, (20000, 2))
+    bboxes = np.hstack([xy, xy + rng.exponential(1.0, (20000, 2))])
+    items = [{'bbox': tuple(b)} for b in bboxes.tolist()]
+    view = (2.0, 48.0, 2.7, 49.2)
+
+    def linear():
+        return [it for it in items if not (it['bbox'][2] < view[0] or it['bbox'][0] > view[2] or
+                                           it['bbox'][3] < view[1] or it['bbox'][1] > view[3])]
+
+    index = GridIndex(bboxes)
+    assert len(linear()) == len(index.query(*view))
+    return {
+        "linear bbox scan": best_of(linear),
+        "grid build": best_of(lambda: GridIndex(bboxes), 3),
+        "grid query": best_of(lambda: index.query(*view), 20),
+    }
+
+@benchmark
+def bench_projection():
+    # batch projection vs the scalar functions it replaces, checks they agree
+    rng = np.random.default_rng(0)
+    lon = rng.uniform(-180, 180, 100000)
+    lat = rng.uniform(-89.9, 89.9, 100000)
+    px, py = rng.uniform(0, 4096, (2, 100000))
+    z, x, y = 12, 2074, 1409
+
+    ref = np.array([mercator_project(a, o) for o, a in zip(lon, lat)])
+    mx, my = lonlat_to_mercator(lon, lat)
+    assert np.abs(ref - np.column_stack([mx, my])).max() < 1e-9
+    back = mercator_to_lonlat(mx, my)[1]
+    assert np.abs(back - [mercator_unproject(v) for v in my]).max() < 1e-9
+
+    ref = np.array([mercator_project(a, o) for o, a in
+                    (tile_coords_to_lonlat(z, x, y, i, j) for i, j in zip(px, py))])
+    tx, ty = tile_to_mercator(z, x, y, px, py)
+    assert np.abs(ref - np.column_stack([tx, ty])).max() < 1e-9
+    rx, ry = mercator_to_tile(z, x, y, tx, ty)
+    assert np.abs(rx - px).max() < 1e-6 and np.abs(ry - py).max() < 1e-6
+
+    def scalar():
+        for i, j in zip(px.tolist(), py.tolist()):
+            o, a = tile_coords_to_lonlat(z, x, y, i, j)
+            mercator_project(a, o)
+
+    return {
+        "scalar tile->mercator x100k": best_of(scalar, 3),
+        "batch tile->mercator x100k": best_of(lambda: tile_to_mercator(z, x, y, px, py)),
+        "batch lonlat->mercator x100k": best_of(lambda: lonlat_to_mercator(lon, lat)),
+    }
+
+def synthetic_coastlines(n, verts, seed=0):
+    # wiggly closed rings, dense like the ne_50m borders
+    rng = np.random.default_rng(seed)
+    rings = []
+    for _ in range(n):
+        cx, cy = rng.uniform(-170, 170), rng.uniform(-70, 70)
+        r = rng.uniform(0.5, 15)
+        t = np.linspace(0, 2 * np.pi, verts)
+        rr = r * (1 + 0.05 * np.cumsum(rng.normal(0, 0.2, verts)) / np.sqrt(verts))
+        ring = np.column_stack([cx + rr * np.cos(t), cy + rr * np.sin(t)])
+        ring[-1] = ring[0]
+        rings.append(ring)
+    return rings
+
+@benchmark
+def bench_lod():
+    layer = LodLayer.from_lines(synthetic_coastlines(300, 2000))
+    buffer = BrailleBuffer(300 * 2, 80 * 4)
+    out = {}
+    for zoom in (1.5, 5.0, 20.0, 60.0):
+        view_w, view_h = 300 / 2.0 / zoom, 80 / zoom
+        ids = layer.query(-view_w / 2, -view_h / 2, view_w / 2, view_h / 2)
+        for name, lines in (("full", layer.levels[0]), ("lod", layer.level_for(zoom))):
+            verts = int(np.sum(np.diff(lines.offsets)[ids]))
+            draw = lambda: buffer.draw_lines(lines, ids, 0.0, 0.0, zoom, 2.0, 1, 1)
+            draw()
+            out[f"zoom {zoom:>5} {name:<4} {verts:>7} verts"] = best_of(draw)
+    return out
+
+def synthetic_tile(z, x, y, roads=400, verts=200, seed=0):
+    # long wiggly roads at full tile resolution
+    rng = np.random.default_rng(seed)
+    builder = TileBuilder()
+    for i in range(roads):
+        line = np.cumsum(rng.normal(0, 8, (verts, 2)), axis=0) + rng.uniform(0, 4096, 2)
+        builder.add(ROAD, tile_coords_to_mercator(z, x, y, line), color=2 + i % 4, z_index=2)
+    return builder.build(tolerance=360.0 / (2 ** z) / 4096)
+
+@benchmark
+def bench_tile_lod():
+    z, x, y = 8, 129, 90
+    tile = synthetic_tile(z, x, y)
+    buffer = BrailleBuffer(300 * 2, 80 * 4)
+    cam_x, cam_y = tile_to_mercator(z, x + 0.5, y + 0.5, 0, 0)
+    out = {"douglas-peucker 80k verts": best_of(lambda: tile.simplified(0.001))}
+    for zoom in (25.0, 60.0, 95.0):
+        view_w, view_h = 300 / 2.0 / zoom, 80 / zoom
+        ids = tile.query(cam_x - view_w / 2, cam_y - view_h / 2, cam_x + view_w / 2, cam_y + view_h / 2)
+        for name, t in (("full", tile), ("lod", tile.lod(zoom))):
+            verts = int(np.sum(np.diff(t.offsets)[ids]))
+            draw = lambda: buffer.draw_features(t, ids, cam_x, cam_y, zoom, 2.0)
+            draw()
+            out[f"zoom {zoom:>5} {name:<4} {verts:>7} verts"] = best_of(draw)
+    return out
+
+@contextmanager
+def local_server(files, pattern=""):
+    # local stand-in for the tile host and the natural earth downloads.
+    # files is {path: (body, seconds)}, a None path answers anything not
+    # listed. bodies trickle out over their seconds, small ones in one
+    # piece at the end. yields the base url + pattern
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+        def do_GET(self):
+            body, secs = files[self.path] if self.path in files else files[None]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            chunk = max(len(body) // 50, 1 << 16)
+            parts = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+            for part in parts:
+                time.sleep(secs / len(parts))
+                self.wfile.write(part)
+        def log_message(self, *args): pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try: yield f"http://127.0.0.1:{server.server_port}{pattern}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+tile_pattern = "/{z}/{x}/{y}.pbf"
+
+@benchmark
+def bench_fetch():
+    import requests
+    with local_server({None: (b"\0" * 512, 0.02)}, tile_pattern) as url:
+        keys = [(12, x, y) for x in range(8) for y in range(6)]
+        out = {}
+
+        # old path: one batch, one tile after another, fresh connection each
+        def sequential():
+            for z, x, y in keys:
+                requests.get(url.format(z=z, x=x, y=y), timeout=10).content
+                time.sleep(0.005)
+        out[f"sequential {len(keys)} tiles"] = best_of(sequential, 1)
+
+        def download(z, x, y):
+            tiles.http_session().get(url.format(z=z, x=x, y=y), timeout=10).content
+            return PackedTile.empty()
+
+        def scheduled(workers):
+            manager = TileManager()
+            fetcher = TileFetcher(manager, workers=workers, process=download)
+            fetcher.want([(k, i) for i, k in enumerate(keys)])
+            while fetcher.pending(): time.sleep(0.001)
+            fetcher.shutdown()
+            assert len(manager.tiles) == len(keys)
+        for workers in (1, 4, 8):
+            out[f"fetcher {workers} workers"] = best_of(lambda: scheduled(workers), 1)
+        # priority order and cancellation are checked in test_fetch.py
+        return out
+
+def synthetic_mvt(z, x, y, roads=300, buildings=1500, unused=600, seed=0):
+    # encoded vector tile shaped like a dense z14 city tile, including
+    # layers the app never draws
+    import mapbox_vector_tile
+    rng = np.random.default_rng(seed + x * 1009 + y)
+    def wkt(pts): return ",".join(f"{a} {b}" for a, b in pts)
+    classes = ["primary", "motorway", "street", "minor", "secondary"]
+    layers = [
+        {"name": "transportation", "features": [
+            {"geometry": f"LINESTRING({wkt(rng.integers(0, 4096, (12, 2)))})",
+             "properties": {"class": classes[i % 5], "name": f"Rd {i}"}} for i in range(roads)]},
+        {"name": "building", "features": [
+            {"geometry": f"POLYGON(({a} {b},{a + 40} {b},{a + 40} {b + 30},{a} {b + 30},{a} {b}))", "properties": {}}
+            for a, b in rng.integers(0, 4000, (buildings, 2))]},
+        {"name": "place", "features": [
+            {"geometry": "POINT(2048 2048)", "properties": {"class": "town", "name": f"Town {x} {y}"}}]},
+        {"name": "landuse", "features": [
+            {"geometry": f"POLYGON(({a} {b},{a + 200} {b},{a + 260} {b + 90},{a + 200} {b + 150},{a} {b + 150},{a} {b}))",
+             "properties": {"class": "residential"}}
+            for a, b in rng.integers(0, 4096, (unused // 2, 2))]},
+        {"name": "housenumber", "features": [
+            {"geometry": f"POINT({a} {b})", "properties": {"housenumber": str(a)}}
+            for a, b in rng.integers(0, 4096, (unused // 2, 2))]},
+    ]
+    return mapbox_vector_tile.encode(layers)
+
+@benchmark
+def bench_decode():
+    # frame times on the main thread while 24 z14 tiles decode in the
+    # background, fetch threads vs the process pool
+    import os
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+    keys = [(14, 8192 + i % 6, 8192 + i // 6) for i in range(24)]
+    with temp_tile_store() as path:
+        fixtures = TileStore(path)
+        fixtures.put_many([(key, synthetic_mvt(*key)) for key in keys])
+        fixtures.close()
+
+        # a frame's worth of rasterizing
+        tile = synthetic_tile(8, 129, 90)
+        buffer = BrailleBuffer(300 * 2, 80 * 4)
+        cam_x, cam_y = tile_to_mercator(8, 129.5, 90.5, 0, 0)
+        ids = np.arange(len(tile))
+        frame = lambda: buffer.draw_features(tile, ids, cam_x, cam_y, 60.0, 2.0)
+        frame()
+        idle = best_of(frame, 20)
+
+        ctx = multiprocessing.get_context("spawn")
+        # leave a core for the render loop
+        workers = max(1, min(4, (os.cpu_count() or 1) - 1))
+        pool = ProcessPoolExecutor(workers, mp_context=ctx)
+        from seed import build_one
+        list(pool.map(build_one, [(0, 0, 0)] * workers))  # warm up, build_one shrugs off a failed fetch
+        backends = {
+            "threads": map_data.process_single_tile,
+            f"{workers} processes": lambda z, x, y: PackedTile.from_bytes(pool.submit(map_data.process_tile_bytes, z, x, y).result()),
+        }
+
+        out = {"idle frame": idle}
+        results = {}
+        for name, process in backends.items():
+            raw_cache.clear()
+            # make every backend decode from scratch
+            store = tiles.tile_store()
+            store.flush()
+            store.db.execute("DELETE FROM processed")
+            manager = TileManager()
+            fetcher = TileFetcher(manager, workers=4, process=process)
+            t0 = time.perf_counter()
+            fetcher.want([(k, i) for i, k in enumerate(keys)])
+            frames = []
+            while fetcher.pending():
+                f0 = time.perf_counter()
+                frame()
+                frames.append(time.perf_counter() - f0)
+            out[f"{name} total"] = time.perf_counter() - t0
+            out[f"{name} frame p95"] = float(np.percentile(frames, 95))
+            out[f"{name} frame max"] = max(frames)
+            fetcher.shutdown()
+            results[name] = manager.tiles
+
+        pool.shutdown()
+        for key in keys:
+            a, b = (done[key] for done in results.values())
+            assert np.array_equal(a.coords, b.coords) and a.names == b.names
+        out["to_bytes + from_bytes"] = best_of(lambda: PackedTile.from_bytes(a.to_bytes()), 20)
+        return out
+
+@benchmark
+def bench_store():
+    # old file per tile cache vs the mbtiles store, 2000 small tiles
+    import os, tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_dir = os.path.join(tmp, "tile_cache")
+        os.makedirs(cache_dir)
+        keys = [(14, 8000 + i % 50, 8000 + i // 50) for i in range(2000)]
+        samples = [synthetic_mvt(14, i, 0, roads=60, buildings=200) for i in range(20)]
+        blobs = {key: samples[i % 20] for i, key in enumerate(keys)}
+        out = {}
+
+        def write_files():
+            for (z, x, y), data in blobs.items():
+                with open(os.path.join(cache_dir, f"tile_{z}_{x}_{y}.pbf"), "wb") as f: f.write(data)
+        out["files write"] = best_of(write_files, 1)
+
+        def read_files():
+            for z, x, y in keys:
+                path = os.path.join(cache_dir, f"tile_{z}_{x}_{y}.pbf")
+                if os.path.exists(path):
+                    with open(path, "rb") as f: f.read()
+        out["files read"] = best_of(read_files, 3)
+
+        store = TileStore(os.path.join(tmp, "tiles.mbtiles"))
+        out["migrate"] = best_of(lambda: migrate(cache_dir, store), 1)
+        assert len(store) == len(keys)
+        out["store read one by one"] = best_of(lambda: [store.get(*key) for key in keys], 3)
+        out["store read batched"] = best_of(lambda: store.get_many(keys), 3)
+        got = store.get_many(keys)
+        assert all(got[key] == blobs[key] for key in keys)
+        print("store", os.path.getsize(store.path), "bytes on disk,", len(os.listdir(cache_dir)), "files before")
+
+        # cap the size, the least recently read tiles go first
+        store.get_many(keys[-100:])
+        store.flush()
+        store.max_bytes = store.bytes_used // 4
+        store.evict()
+        assert store.bytes_used <= store.max_bytes
+        assert all(store.get(*key) is not None for key in keys[-100:])
+        print("store", store.stats(), len(store), "left")
+        store.close()
+        return out
+
+@benchmark
+def bench_processed():
+    # opening 12 dense z14 tiles: nothing stored (download from a local
+    # server + decode + process), raw pbf stored, processed tile stored
+    with local_server({None: (synthetic_mvt(14, 0, 0), 0.02)}, tile_pattern) as url, temp_tile_store(url):
+        keys = [(14, 8192 + i % 4, 8192 + i // 4) for i in range(12)]
+
+        def load_all():
+            raw_cache.clear()
+            return [map_data.process_single_tile(*key) for key in keys]
+
+        out = {"cold": best_of(load_all, 1)}
+        cold = load_all()
+        map_data.tile_processing_version += 1   # processed copies no longer match
+        out["warm raw"] = best_of(load_all, 1)
+        out["warm processed"] = best_of(load_all, 3)
+        warm = load_all()
+        for a, b in zip(cold, warm):
+            assert np.array_equal(a.coords, b.coords) and np.array_equal(a.offsets, b.offsets) and a.names == b.names
+        print("processed", tiles.tile_store().stats())
+        return out
+
+@benchmark
+def bench_memory():
+    # what stays in memory after opening 8 dense tiles, old per function
+    # lru_caches (raw + fully decoded dicts) vs the byte bounded raw cache
+    import tracemalloc, functools, mapbox_vector_tile
+    with temp_tile_store():
+        keys = [(14, 8192 + i % 4, 8192 + i // 4) for i in range(8)]
+        tiles.tile_store().put_many([(key, synthetic_mvt(*key)) for key in keys])
+        map_data.tile_processing_version += 1
+        out = {}
+
+        old_raw = functools.lru_cache(4096)(lambda z, x, y: tiles.tile_store().get(z, x, y))
+        old_decode = functools.lru_cache(4096)(lambda z, x, y: mapbox_vector_tile.decode(old_raw(z, x, y)))
+        def old():
+            return [map_data.build_tile(*key, old_decode(*key)) for key in keys]
+        def new():
+            return [map_data.process_single_tile(*key) for key in keys]
+
+        map_data.build_tile(*keys[0], mapbox_vector_tile.decode(tiles.tile_store().get(*keys[0])))  # jit warm up
+        for name, load in (("lru_cache", old), ("byte cache", new)):
+            # fresh caches for a timed run, then again under tracemalloc
+            for traced in (False, True):
+                map_data.tile_processing_version += 1
+                raw_cache.clear()
+                old_raw.cache_clear()
+                old_decode.cache_clear()
+                if traced: tracemalloc.start()
+                t0 = time.perf_counter()
+                built = load()
+                if not traced: out[f"{name} load"] = time.perf_counter() - t0
+            del built
+            held, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"memory           {name:<10} holds {held / 1e6:6.1f} MB after the tiles are built")
+        print("memory", tiles.cache_stats()['raw'])
+        return out
+
+@benchmark
+def bench_zoom_policy():
+    # zooming in and out by +-15% around the z12/z14 switch for 200 frames,
+    # old hard coded thresholds vs the policy. counts level switches and
+    # tiles that had to be requested again
+    from tiles import tiles_for_bbox
+    cam_x, cam_y = 2.35, 48.85
+    cols, rows = 160, 48
+    zooms = 1456 * (1 + 0.15 * np.sin(np.linspace(0, 12 * np.pi, 200)))
+
+    def old(zoom):
+        tile_z = 14 if zoom > 1500 else 12
+        return 8 if zoom < 100 else tile_z
+
+    out = {}
+    policy = TileZoomPolicy()
+    for name, pick in (("thresholds", old), ("policy", lambda z: policy.update(z, 2.0))):
+        seen, current, fetched, switches, last = set(), set(), 0, 0, None
+        t0 = time.perf_counter()
+        for zoom in zooms:
+            tile_z = pick(zoom)
+            if last is not None and tile_z != last: switches += 1
+            last = tile_z
+            w, h = cols / 2.0 / zoom, rows / zoom
+            lat0, lat1 = mercator_to_lonlat(0, cam_y - h / 2)[1], mercator_to_lonlat(0, cam_y + h / 2)[1]
+            keys = set(tiles_for_bbox(cam_x - w / 2, lat0, cam_x + w / 2, lat1, tile_z))
+            # a tile dropped from the set and needed again costs a refetch
+            fetched += len(keys - current)
+            current = keys
+        out[name] = time.perf_counter() - t0
+        print(f"zoom_policy      {name:<12} {switches:3d} level switches, {fetched:4d} tile requests")
+    return out
+
+@benchmark
+def bench_prefetch():
+    # a scripted session at 30 fps: pan east 4 s, pause, pan north 3 s,
+    # zoom in 3 s, pan west 3 s, zoom out 3 s. tiles arrive 10 frames after they are
+    # requested. old 60% padding vs motion prediction
+    fps, latency = 30, 10
+    cols, rows, aspect = 160, 48, 2.0
+    path = []
+    x, y, zoom = 2.35, 56.0, 600.0
+    # an arrow key held down is ~10 presses of 10 / zoom a second
+    for dx, dy, dz, secs in ((1, 0, 1, 4), (0, 0, 1, 1), (0, 1, 1, 3), (0, 0, 1.03, 3), (-1, 0, 1, 3), (0, 0, 1 / 1.03, 3)):
+        for _ in range(secs * fps):
+            x += dx * 100 / fps / zoom
+            y += dy * 100 / fps / zoom
+            zoom *= dz
+            path.append((x, y, zoom))
+
+    def padded(view, tile_z, prefetcher):
+        min_x, min_y, max_x, max_y = view
+        px, py = (max_x - min_x) * 0.6, (max_y - min_y) * 0.6
+        return tiles_for_view(min_x - px, min_y - py, max_x + px, max_y + py, tile_z)
+
+    def predicted(view, tile_z, prefetcher):
+        return [key for key, _ in prefetcher.plan(view, tile_z, aspect)]
+
+    out = {}
+    for name, extra in (("60% padding", padded), ("prediction", predicted)):
+        policy, prefetcher = TileZoomPolicy(), Prefetcher()
+        arrives = {}  # key -> frame it is loaded
+        on_screen, late = set(), 0
+        t0 = time.perf_counter()
+        for frame, (cx, cy, zoom) in enumerate(path):
+            w, h = cols / 2.0 / zoom, rows / zoom
+            view = (cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2)
+            tile_z = policy.update(zoom, aspect)
+            visible = tiles_for_view(*view, tile_z)
+            prefetcher.observe(cx, cy, zoom, frame / fps)
+            ahead = [k for k in extra(view, tile_z, prefetcher) if k not in visible]
+            for key in visible + ahead: arrives.setdefault(key, frame + latency)
+            # a tile is late if it wasnt loaded the first frame it was on screen
+            late += sum(1 for key in visible if key not in on_screen and arrives[key] > frame)
+            on_screen.update(visible)
+            prefetcher.record([k for k in ahead if arrives[k] > frame], [k for k in visible if arrives[k] > frame], visible, frame / fps)
+        out[name] = time.perf_counter() - t0
+        used = len(on_screen) / len(arrives)
+        print(f"prefetch         {name:<12} {len(arrives):4d} tiles fetched, {used:4.0%} ever on screen, "
+              f"{late:3d} shown late, {prefetcher.stats()}")
+    return out
+
+def synthetic_base_layers(countries=240, places=7300, roads=40000, seed=0):
+    # stand ins for the natural earth downloads, about the size of 50m
+    # borders / 10m places / 10m roads: (borders geojson, places geojson,
+    # [road lon/lat arrays])
+    rng = np.random.default_rng(seed)
+    features = []
+    for i in range(countries):
+        # a wobbly ring of ~400 points per country
+        cx, cy, r = rng.uniform(-170, 170), rng.uniform(-60, 70), rng.uniform(1, 10)
+        t = np.linspace(0, 2 * np.pi, 400)
+        ring = np.c_[cx + r * np.cos(t) * rng.uniform(0.8, 1.2, 400), cy + r * np.sin(t) * rng.uniform(0.8, 1.2, 400)]
+        ring[-1] = ring[0]
+        features.append({"type": "Feature", "properties": {"name": f"Country {i}"},
+                         "geometry": {"type": "Polygon", "coordinates": [ring.tolist()]}})
+    borders = {"type": "FeatureCollection", "features": features}
+    points = [{"type": "Feature", "properties": {"name": f"Place {i}", "pop_max": int(p)},
+               "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]}}
+              for i, (p, lon, lat) in enumerate(zip(rng.integers(500, 10 ** 7, places), rng.uniform(-180, 180, places), rng.uniform(-60, 70, places)))]
+    lines = [rng.uniform(-170, 170, 2) + np.cumsum(rng.uniform(-0.05, 0.05, (20, 2)), axis=0) for _ in range(roads)]
+    return borders, {"type": "FeatureCollection", "features": points}, lines
+
+@benchmark
+def bench_startup():
+    # base layers at startup: cold parses the raw caches and builds every
+    # lod level, warm reads the snapshot the cold run left behind
+    import os, json
+    with temp_base_caches():
+
+        borders, places, lines = synthetic_base_layers()
+        with open(map_data.borders_cache, "w") as f: json.dump(borders, f)
+        with open(map_data.cities_cache, "w") as f: json.dump(places, f)
+        map_data.save_roads(*pack_lines([lonlat_coords_to_mercator(line) for line in lines]))
+
+        def start():
+            data = map_data.mapData()
+            t0 = time.perf_counter()
+            map_data.load_initial_data(data)
+            secs = time.perf_counter() - t0
+            data.shutdown()
+            assert data.status == "Ready", data.status
+            return data, secs
+
+        cold, out = start()
+        assert os.path.exists(map_data.base_snapshot)
+        warm, _ = start()
+        out = {"cold": out, "warm (snapshot)": min(start()[1] for _ in range(3))}
+        for layer in ("borders", "roads"):
+            a, b = getattr(cold, layer), getattr(warm, layer)
+            assert a.tolerances == b.tolerances
+            for la, lb in zip(a.levels, b.levels):
+                assert np.array_equal(la.coords, lb.coords) and np.array_equal(la.offsets, lb.offsets)
+            assert np.array_equal(a.query(0, 0, 20, 20), b.query(0, 0, 20, 20))
+        assert cold.countries_coords == warm.countries_coords
+        print(f"startup          snapshot {os.path.getsize(map_data.base_snapshot) / 1e6:.1f} MB, "
+              f"{len(warm.borders)} border rings, {len(warm.roads)} roads, {len(warm.countries_coords)} cities")
+        return out
+
+@benchmark
+def bench_first_frame():
+    # fresh interpreter, importing everything main.py does, up to the
+    # first composed map frame. cold starts with an empty numba cache,
+    # warm reuses what cold left there
+    import os, subprocess, tempfile, json
+    script = """
+import time
+t0 = time.perf_counter()
+import sys, json
+import numpy as np
+import main
+from braille import BrailleBuffer
+from geometry import PackedLines, pack_lines
+t1 = time.perf_counter()
+rng = np.random.default_rng(0)
+layer = PackedLines(*pack_lines([np.cumsum(rng.uniform(-1, 1, (50, 2)), axis=0) for _ in range(200)]))
+buf = BrailleBuffer(320, 192)
+buf.draw_lines(layer, np.arange(len(layer)), 0.0, 0.0, 1.0, 2.0, 1, 1)
+buf.frame()
+t2 = time.perf_counter()
+print(json.dumps([t1 - t0, t2 - t1, [m for m in ("shapely", "pandas", "geopandas") if m in sys.modules]]))
+"""
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, NUMBA_CACHE_DIR=cache)
+        here = os.path.dirname(os.path.abspath(__file__))
+        out = {}
+        for name in ("cold", "warm"):
+            t0 = time.perf_counter()
+            res = subprocess.run([sys.executable, "-c", script], cwd=here, env=env, capture_output=True, text=True, check=True)
+            total = time.perf_counter() - t0
+            imports, frame, geo = json.loads(res.stdout.strip().splitlines()[-1])
+            print(f"first_frame      {name}: imports {imports * 1000:6.0f} ms, first frame {frame * 1000:6.0f} ms, geo modules loaded {geo}")
+            out[f"{name} (process start to frame)"] = total
+        return out
+
+@benchmark
+def bench_interactive():
+    # fresh machine, nothing cached: borders (0.5 s), places (0.3 s) and
+    # the roads zip (2 s) come from a local server. time until the map is
+    # usable and until every layer is in, old one after another loader
+    # vs the parallel one
+    import os, io, json, zipfile, threading
+    import geopandas as gpd
+    from shapely.geometry import LineString
+    borders, places, lines = synthetic_base_layers(roads=10000)
+    with temp_base_caches() as tmp:
+        gpd.GeoDataFrame({"scalerank": np.full(len(lines), 5)}, geometry=[LineString(l) for l in lines],
+                         crs=4326).to_file(os.path.join(tmp, "roads.shp"))
+        roads_zip = io.BytesIO()
+        with zipfile.ZipFile(roads_zip, "w") as z:
+            for name in os.listdir(tmp): z.write(os.path.join(tmp, name), name)
+        files = {
+            "/borders.json": (json.dumps(borders).encode(), 0.5),
+            "/places.json": (json.dumps(places).encode(), 0.3),
+            "/roads.zip": (roads_zip.getvalue(), 2.0),
+        }
+        with local_server(files) as url, patched(map_data, country_borders=url + "/borders.json",
+                                                 populated_places=url + "/places.json", roads_zip=url + "/roads.zip"):
+            def sequential(data):
+                # what load_initial_data used to do
+                data.borders = LodLayer.from_lines([item['geom'] for item in map_data.download_borders(data)])
+                data.roads = LodLayer(*map_data.download_global_roads(data))
+                data.countries_coords = map_data.download_cities(data)
+                data.data_loaded = True
+
+            out = {}
+            for name, load in (("sequential", sequential), ("parallel", map_data.load_initial_data)):
+                for path in (map_data.borders_cache, map_data.cities_cache, map_data.roads_cache, map_data.base_snapshot):
+                    if os.path.exists(path): os.remove(path)
+                data = map_data.mapData()
+                loader = threading.Thread(target=load, args=(data,))
+                t0 = time.perf_counter()
+                loader.start()
+                # polled like main.py's loading screen
+                while not data.data_loaded: time.sleep(0.005)
+                out[f"{name} interactive"] = time.perf_counter() - t0
+                loader.join()
+                out[f"{name} all layers"] = time.perf_counter() - t0
+                assert len(data.borders) == len(borders["features"]) and len(data.roads) == len(lines) and data.countries_coords
+                data.shutdown()
+            return out
+
+@benchmark
+def bench_roads():
+    # first run road build from the same ne_10m_roads sized shapefile
+    # (a fifth of it multi part): the old iterrows + pickled dicts path vs
+    # ingest_roads + packed npz. time, peak memory and reading the cache back
+    import os, tempfile, tracemalloc
+    import pandas as pd
+    import geopandas as gpd
+    from shapely.geometry import LineString, MultiLineString
+    _, _, lines = synthetic_base_layers(countries=0, places=0, roads=60000, seed=3)
+    geoms = [MultiLineString([lines[i], lines[i + 1]]) if i % 10 == 0 else LineString(lines[i]) for i in range(0, len(lines) - 1)
+             if i % 10 != 1]
+    with tempfile.TemporaryDirectory() as tmp:
+        shp = os.path.join(tmp, "ne_10m_roads.shp")
+        gpd.GeoDataFrame({"scalerank": np.arange(len(geoms)) % 10 + 1}, geometry=geoms, crs=4326).to_file(shp)
+
+        def legacy():
+            # what download_global_roads used to do after unzipping
+            gdf = gpd.read_file(shp)
+            if 'scalerank' in gdf.columns:
+                gdf = gdf[gdf['scalerank'] <= 8]
+            processed_roads = []
+            for _, row in gdf.iterrows():
+                geom = row['geometry']
+                parts = geom.geoms if geom.geom_type == 'MultiLineString' else [geom]
+                for part in parts:
+                    coords = lonlat_coords_to_mercator(np.asarray(part.coords)[:, :2])
+                    if len(coords):
+                        bbox = tuple(coords.min(axis=0).tolist() + coords.max(axis=0).tolist())
+                        processed_roads.append({'bbox': bbox, 'geom': coords.tolist()})
+            pd.to_pickle(processed_roads, os.path.join(tmp, "cache_roads.pkl"))
+        def legacy_load():
+            return pack_lines([road['geom'] for road in pd.read_pickle(os.path.join(tmp, "cache_roads.pkl"))])
+
+        def packed():
+            map_data.save_roads(*map_data.ingest_roads(shp), os.path.join(tmp, "cache_roads.npz"))
+        def packed_load():
+            return map_data.load_roads(os.path.join(tmp, "cache_roads.npz"))
+
+        out = {}
+        for name, build, load, cache in (("iterrows + pickle", legacy, legacy_load, "cache_roads.pkl"),
+                                         ("vectorized + npz", packed, packed_load, "cache_roads.npz")):
+            out[f"{name} build"] = best_of(build, 1)
+            tracemalloc.start()
+            build()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            out[f"{name} load"] = best_of(load, 3)
+            print(f"roads            {name:<18} peak {peak / 1e6:6.1f} MB, cache {os.path.getsize(os.path.join(tmp, cache)) / 1e6:5.1f} MB")
+        (c0, o0), (c1, o1) = legacy_load(), packed_load()
+        assert np.array_equal(o0, o1) and np.allclose(c0, c1, rtol=0, atol=1e-9)
+        print(f"roads            {len(o1) - 1} lines, {len(c1)} points")
+        return out
+
+@benchmark
+def bench_render():
+    # headless Renderer, 160x48: render + ansi encode per frame at a few
+    # zoom bands, base layers only below zoom 20, dense z14 tiles above
+    import mapbox_vector_tile
+    from render import Renderer, to_ansi
+    borders, places, lines = synthetic_base_layers(roads=5000)
+    data = map_data.mapData()
+    data.borders = LodLayer.from_lines([lonlat_coords_to_mercator(f["geometry"]["coordinates"][0]) for f in borders["features"]])
+    data.roads = LodLayer.from_lines([lonlat_coords_to_mercator(line) for line in lines])
+    data.countries_coords = sorted(({'name': p["properties"]["name"], 'pop': p["properties"]["pop_max"],
+                                     'coords': tuple(lonlat_coords_to_mercator(p["geometry"]["coordinates"])[0])}
+                                    for p in places["features"]), key=lambda c: c['pop'], reverse=True)
+    z, x0, y0 = 14, 8192, 5460
+    for i in range(9):
+        key = (z, x0 + i % 3, y0 + i // 3)
+        data.tile_manager.add_tile(*key, map_data.build_tile(*key, mapbox_vector_tile.decode(synthetic_mvt(*key, seed=i))))
+    cam_x, cam_y = tile_to_mercator(z, x0 + 1.5, y0 + 1.5, 0, 0)
+
+    renderer = Renderer(data, 160, 48)
+    warm_up()
+    out = {}
+    rng = np.random.default_rng(1)
+    for zoom in (1.5, 10.0, 40.0, 3000.0):
+        # jittered cameras so nothing is cached between frames
+        span = 60.0 / zoom
+        cams = [(cam_x + dx, cam_y + dy) for dx, dy in rng.uniform(-span, span, (50, 2))]
+        to_ansi(renderer.render(*cams[0], zoom))
+        t0 = time.perf_counter()
+        for cx, cy in cams: to_ansi(renderer.render(cx, cy, zoom))
+        secs = (time.perf_counter() - t0) / len(cams)
+        print(f"render           zoom {zoom:>6}: {1 / secs:7.1f} fps")
+        out[f"zoom {zoom:>6} frame"] = secs
+    data.shutdown()
+    return out
+
+# synthetic z14 tiles standing in for the kinds of places people look at.
+# generated from fixed seeds, so every run and every commit sees the same bytes
+fixture_profiles = {
+    'city': dict(roads=300, buildings=1500, unused=600),
+    'suburb': dict(roads=120, buildings=400, unused=200),
+    'rural': dict(roads=25, buildings=15, unused=40),
+    'ocean': dict(roads=0, buildings=0, unused=0),
+}
+fixture_key = (14, 8192, 5460)
+
+def fixture_mvt(profile):
+    return synthetic_mvt(*fixture_key, seed=sorted(fixture_profiles).index(profile), **fixture_profiles[profile])
+
+@benchmark
+def bench_tiles():
+    # the stages of process_single_tile per fixture, from raw bytes already
+    # in memory: decode (only the layers we use), build the PackedTile,
+    # to_bytes + from_bytes for the process pool / store round trip
+    out = {}
+    for profile in fixture_profiles:
+        raw = fixture_mvt(profile)
+        raw_cache.clear()
+        raw_cache.put(fixture_key, raw)
+        decoded = tiles.decode_mvt(*fixture_key)
+        tile = map_data.build_tile(*fixture_key, decoded)
+        data = tile.to_bytes()
+        out[f"{profile} decode"] = best_of(lambda: tiles.decode_mvt(*fixture_key), 10)
+        out[f"{profile} build"] = best_of(lambda: map_data.build_tile(*fixture_key, decoded), 10)
+        out[f"{profile} to/from bytes"] = best_of(lambda: PackedTile.from_bytes(tile.to_bytes()), 10)
+        print(f"tiles            {profile:<6} {len(raw) / 1e3:6.1f} kB pbf, {len(tile)} features, "
+              f"{len(tile.coords)} points, {len(data) / 1e3:6.1f} kB packed")
+    raw_cache.clear()
+    return out
+
+@benchmark
+def bench_stages():
+    # the per frame hot paths one at a time on the city fixture
+    from drawing_utils import LabelManager, draw_projected_polyline_braille
+    from simplify import simplify_lines
+    raw_cache.put(fixture_key, fixture_mvt('city'))
+    tile = map_data.build_tile(*fixture_key, tiles.decode_mvt(*fixture_key))
+    raw_cache.clear()
+    cam_x, cam_y = tile_to_mercator(*fixture_key, 2048, 2048)
+    zoom, aspect = 3000.0, 2.0
+    buffer = BrailleBuffer(160 * 2, 48 * 4)
+    roads = [tile.line(i) for i in np.flatnonzero(tile.kind == ROAD)]
+    out = {}
+
+    for tol in (0.00001, 0.0001):
+        simplify_lines(tile.coords, tile.offsets, tol)
+        out[f"simplify_lines tol {tol}"] = best_of(lambda: simplify_lines(tile.coords, tile.offsets, tol), 30)
+
+    def per_line():
+        for line in roads: draw_projected_polyline_braille(buffer, line, cam_x, cam_y, zoom, aspect, 0, 0, 2, 2)
+    warm_up()
+    out[f"draw_projected_polyline x{len(roads)}"] = best_of(per_line, 10)
+    ids = tile.query(cam_x - 0.01, cam_y - 0.01, cam_x + 0.01, cam_y + 0.01)
+    out[f"draw_features {len(ids)} lines"] = best_of(lambda: buffer.draw_features(tile, ids, cam_x, cam_y, zoom, aspect), 10)
+    out["BrailleBuffer.frame 160x48"] = best_of(buffer.frame, 200)
+
+    # label placement: 300 candidates against whatever got placed before
+    rng = np.random.default_rng(0)
+    spots = [(int(x), int(y), int(n)) for x, y, n in zip(rng.integers(0, 160, 300), rng.integers(0, 48, 300), rng.integers(4, 16, 300))]
+    def place():
+        labels = LabelManager(160, 48)
+        for x, y, n in spots:
+            if labels.can_draw(x, y, n): labels.register(x, y, n)
+        return labels
+    out[f"LabelManager 300 labels, {len(place().occupied)} placed"] = best_of(place, 50)
+
+    # tiles for a city sized view and a region sized one
+    for name, (lon0, lat0, lon1, lat1) in (("city", (2.25, 48.8, 2.45, 48.92)), ("region", (-5.0, 42.0, 8.0, 51.0))):
+        n = len(tiles.tiles_for_bbox(lon0, lat0, lon1, lat1, 14))
+        out[f"tiles_for_bbox z14 {name} ({n})"] = best_of(lambda: tiles.tiles_for_bbox(lon0, lat0, lon1, lat1, 14), 30)
+    return out
+
+## runner
+def environment():
+    # what a report was measured on, so diffs between machines stand out
+    import os, platform, subprocess, numba
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception: commit = ""
+    return {'commit': commit, 'python': platform.python_version(), 'numpy': np.__version__,
+            'numba': numba.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'date': time.strftime("%Y-%m-%d %H:%M:%S")}
+
+def run(names):
+    # {name: {label: ms}}
+    results = {}
+    for name in names:
+        results[name] = {}
+        for label, secs in benchmarks[name]().items():
+            print(f"{name:<16} {label:<32} {secs * 1000:10.3f} ms")
+            results[name][label] = round(secs * 1000, 4)
+    return results
+
+def compare(old_path, new_path, threshold=0.1):
+    # side by side of two --json reports, changes past threshold flagged
+    import json
+    with open(old_path) as f: old = json.load(f)
+    with open(new_path) as f: new = json.load(f)
+    print(f"old: {old['environment'].get('commit') or old_path}  new: {new['environment'].get('commit') or new_path}")
+    for name in new['results']:
+        for label, ms in new['results'][name].items():
+            before = old['results'].get(name, {}).get(label)
+            if before is None:
+                print(f"{name:<16} {label:<32} {'':>10}    {ms:10.3f} ms  new")
+                continue
+            ratio = ms / before if before else float("inf")
+            flag = "slower" if ratio > 1 + threshold else "faster" if ratio < 1 - threshold else ""
+            print(f"{name:<16} {label:<32} {before:10.3f} -> {ms:10.3f} ms  {ratio:5.2f}x {flag}")
+
+if __name__ == "__main__":
+    # python bench.py [name ...] [--json report.json]
+    # python bench.py --compare old.json new.json
+    args = sys.argv[1:]
+    if args[:1] == ["--compare"]:
+        compare(args[1], args[2])
+        sys.exit(0)
+    report = None
+    if "--json" in args:
+        i = args.index("--json")
+        report = args[i + 1]
+        del args[i:i + 2]
+    results = run(args or list(benchmarks))
+    if report:
+        import json
+        with open(report, "w") as f:
+            json.dump({'environment': environment(), 'results': results}, f, indent=1)
@@ -2,7 +2,7 @@ import math
 import numpy as np
 from numba import jit
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def fast_set_pixel(buffer_arr, colors_arr, z_buf_arr, x, y, color, z_index, pixel_map):
     rows, cols = buffer_arr.shape
     
@@ -28,6 +28,133 @@ def fast_set_pixel(buffer_arr, colors_arr, z_buf_arr, x, y, color, z_index, pixe
             colors_arr[char_y, char_x] = color
             z_buf_arr[char_y, char_x] = z_index
 
+@jit(nopython=True, cache=True)
+def fast_draw_line(buffer_arr, colors_arr, z_buf_arr, x0, y0, x1, y1, color, z_index, pixel_map):
+    rows, cols = buffer_arr.shape
+    w = cols * 2
+    h = rows * 4
+
+    # trivial reject, both ends off the same side
+    if (x0 < 0 and x1 < 0) or (x0 >= w and x1 >= w): return
+    if (y0 < 0 and y1 < 0) or (y0 >= h and y1 >= h): return
+
+    # clip long segments to the buffer so we dont walk millions of offscreen pixels
+    if x0 < -1 or x0 > w or y0 < -1 or y0 > h or x1 < -1 or x1 > w or y1 < -1 or y1 > h:
+        fx0, fy0 = float(x0), float(y0)
+        ddx, ddy = float(x1 - x0), float(y1 - y0)
+        t0, t1 = 0.0, 1.0
+        for p, q in ((-ddx, fx0 + 1.0), (ddx, w - fx0), (-ddy, fy0 + 1.0), (ddy, h - fy0)):
+            if p == 0.0:
+                if q < 0.0: return
+            else:
+                r = q / p
+                if p < 0.0:
+                    if r > t1: return
+                    if r > t0: t0 = r
+                else:
+                    if r < t0: return
+                    if r < t1: t1 = r
+        x0, y0, x1, y1 = (int(fx0 + t0 * ddx), int(fy0 + t0 * ddy),
+                          int(fx0 + t1 * ddx), int(fy0 + t1 * ddy))
+
+    # bresenham
+    dx = abs(x1 - x0)
+    dy = abs(y1 - y0)
+    sx = 1 if x0 < x1 else -1
+    sy = 1 if y0 < y1 else -1
+    err = dx - dy
+
+    while True:
+        fast_set_pixel(buffer_arr, colors_arr, z_buf_arr, x0, y0, color, z_index, pixel_map)
+
+        if x0 == x1 and y0 == y1: break
+        e2 = 2 * err
+        if e2 > -dy:
+            err -= dy
+            x0 += sx
+        if e2 < dx:
+            err += dx
+            y0 += sy
+
+@jit(nopython=True, cache=True)
+def fast_draw_path(buffer_arr, colors_arr, z_buf_arr, coords, start, end,
+                   cam_x, cam_y, scale_x, scale_y, cx, cy, color, z_index, pixel_map):
+    # project + walk one polyline, coords[start:end]
+    if end - start < 2: return
+
+    px = int((coords[start, 0] - cam_x) * scale_x + cx)
+    py = int(-(coords[start, 1] - cam_y) * scale_y + cy)
+    for i in range(start + 1, end):
+        nx = int((coords[i, 0] - cam_x) * scale_x + cx)
+        ny = int(-(coords[i, 1] - cam_y) * scale_y + cy)
+        fast_draw_line(buffer_arr, colors_arr, z_buf_arr, px, py, nx, ny, color, z_index, pixel_map)
+        px, py = nx, ny
+
+@jit(nopython=True, cache=True)
+def fast_draw_polylines(buffer_arr, colors_arr, z_buf_arr, coords, offsets,
+                        cam_x, cam_y, zoom, aspect_ratio, width, height, color, z_index, pixel_map):
+    # coords is (n, 2) mercator, polyline i is coords[offsets[i]:offsets[i+1]]
+    scale_x = zoom * aspect_ratio * 2
+    scale_y = zoom * 4
+    cx = width // 2
+    cy = height // 2
+
+    for i in range(len(offsets) - 1):
+        fast_draw_path(buffer_arr, colors_arr, z_buf_arr, coords, offsets[i], offsets[i + 1],
+                       cam_x, cam_y, scale_x, scale_y, cx, cy, color, z_index, pixel_map)
+
+@jit(nopython=True, cache=True)
+def fast_draw_subset(buffer_arr, colors_arr, z_buf_arr, coords, offsets, ids, color, z_index,
+                     cam_x, cam_y, zoom, aspect_ratio, width, height, pixel_map):
+    # some of the lines of a packed array, all in one color
+    scale_x = zoom * aspect_ratio * 2
+    scale_y = zoom * 4
+    cx = width // 2
+    cy = height // 2
+
+    for j in range(len(ids)):
+        i = ids[j]
+        fast_draw_path(buffer_arr, colors_arr, z_buf_arr, coords, offsets[i], offsets[i + 1],
+                       cam_x, cam_y, scale_x, scale_y, cx, cy, color, z_index, pixel_map)
+
+@jit(nopython=True, cache=True)
+def fast_draw_features(buffer_arr, colors_arr, z_buf_arr, coords, offsets, ids, feature_colors, feature_z,
+                       cam_x, cam_y, zoom, aspect_ratio, width, height, pixel_map):
+    # like fast_draw_polylines but for a subset of lines with per-line color/z
+    scale_x = zoom * aspect_ratio * 2
+    scale_y = zoom * 4
+    cx = width // 2
+    cy = height // 2
+
+    for j in range(len(ids)):
+        i = ids[j]
+        fast_draw_path(buffer_arr, colors_arr, z_buf_arr, coords, offsets[i], offsets[i + 1],
+                       cam_x, cam_y, scale_x, scale_y, cx, cy, feature_colors[i], feature_z[i], pixel_map)
+
+@jit(nopython=True, cache=True)
+def fast_find_runs(values):
+    # runs of equal values along each row -> (row, start, length, value)
+    rows, cols = values.shape
+    count = 0
+    for y in range(rows):
+        for x in range(cols):
+            if x == 0 or values[y, x] != values[y, x - 1]:
+                count += 1
+
+    runs = np.empty((count, 4), dtype=np.int64)
+    i = 0
+    for y in range(rows):
+        start = 0
+        for x in range(1, cols + 1):
+            if x == cols or values[y, x] != values[y, start]:
+                runs[i, 0] = y
+                runs[i, 1] = start
+                runs[i, 2] = x - start
+                runs[i, 3] = values[y, start]
+                i += 1
+                start = x
+    return runs
+
 class BrailleBuffer:
     def __init__(self, width, height):
         self.width = width
@@ -65,24 +192,106 @@ class BrailleBuffer:
             self.pixel_map
         )
 
+    def draw_line(self, x0, y0, x1, y1, color_pair=0, z_index=0):
+        fast_draw_line(
+            self.buffer, self.colors, self.z_buffer,
+            int(x0), int(y0), int(x1), int(y1), int(color_pair), int(z_index),
+            self.pixel_map
+        )
+
+    def draw_polyline(self, coords, cam_x, cam_y, zoom, aspect_ratio, color_pair=0, z_index=0):
+        if len(coords) < 2: return
+        coords = np.asarray(coords, dtype=np.float64)
+        offsets = np.array([0, len(coords)], dtype=np.int64)
+        self.draw_polylines(coords, offsets, cam_x, cam_y, zoom, aspect_ratio, color_pair, z_index)
+
+    def draw_polylines(self, coords, offsets, cam_x, cam_y, zoom, aspect_ratio, color_pair=0, z_index=0):
+        # whole batch in one compiled call
+        fast_draw_polylines(
+            self.buffer, self.colors, self.z_buffer, coords, offsets,
+            float(cam_x), float(cam_y), float(zoom), float(aspect_ratio),
+            self.width, self.height, int(color_pair), int(z_index),
+            self.pixel_map
+        )
+
+    def draw_lines(self, packed, ids, cam_x, cam_y, zoom, aspect_ratio, color_pair=0, z_index=0):
+        # packed is a geometry.PackedLines, ids picks which lines to draw
+        if len(ids) == 0: return
+        fast_draw_subset(
+            self.buffer, self.colors, self.z_buffer, packed.coords, packed.offsets,
+            np.asarray(ids, dtype=np.int64), int(color_pair), int(z_index),
+            float(cam_x), float(cam_y), float(zoom), float(aspect_ratio),
+            self.width, self.height, self.pixel_map
+        )
+
+    def draw_features(self, packed, ids, cam_x, cam_y, zoom, aspect_ratio, clip=None):
+        # packed is a geometry.PackedTile, ids picks which lines to draw.
+        # clip is an optional (col0, row0, col1, row1) window of cells,
+        # nothing outside it gets touched
+        if len(ids) == 0: return
+        buffer, colors, z_buffer = self.buffer, self.colors, self.z_buffer
+        width, height = self.width, self.height
+        if clip is not None:
+            col0, row0, col1, row1 = clip
+            if col0 >= col1 or row0 >= row1: return
+            window = np.s_[row0:row1, col0:col1]
+            buffer, colors, z_buffer = buffer[window], colors[window], z_buffer[window]
+            # the kernel centers on width // 2, move that into the window
+            width, height = width - 4 * col0, height - 8 * row0
+        fast_draw_features(
+            buffer, colors, z_buffer, packed.coords, packed.offsets,
+            np.asarray(ids, dtype=np.int64), packed.color, packed.z_index,
+            float(cam_x), float(cam_y), float(zoom), float(aspect_ratio),
+            width, height, self.pixel_map
+        )
+
+    def cells(self, min_x, min_y, max_x, max_y, cam_x, cam_y, zoom, aspect_ratio):
+        # mercator rect -> the (col0, row0, col1, row1) cells it covers, the
+        # inverse of the projection in fast_draw_path, rounded to whole cells
+        scale_x = zoom * aspect_ratio * 2
+        scale_y = zoom * 4
+        col0 = round(((min_x - cam_x) * scale_x + self.width // 2) / 2)
+        col1 = round(((max_x - cam_x) * scale_x + self.width // 2) / 2)
+        row0 = round((-(max_y - cam_y) * scale_y + self.height // 2) / 4)
+        row1 = round((-(min_y - cam_y) * scale_y + self.height // 2) / 4)
+        return (min(max(col0, 0), self.cols), min(max(row0, 0), self.rows),
+                min(max(col1, 0), self.cols), min(max(row1, 0), self.rows))
+
+    def glyphs(self):
+        # 0x2800 + bitmask = Braille Character, empty cells are spaces
+        return np.where(self.buffer != 0, self.braille_base + self.buffer.astype(np.uint32), 0x20).astype(np.uint32)
+
     def frame(self):
-        # Optimized frame generation
-        output_lines = []
-        
-        # iterate rows
-        for y in range(self.rows):
-            line_chars = []
-            row_buf = self.buffer[y]
-            row_col = self.colors[y]
-            
-            for x in range(self.cols):
-                val = int(row_buf[x])
-                
-                if val == 0:
-                    line_chars.append((" ", 0))
-                else:
-                    # 0x2800 + bitmask = Braille Character
-                    line_chars.append((chr(self.braille_base + val), int(row_col[x])))
-            output_lines.append(line_chars)
-            
-        return output_lines
\ No newline at end of file
+        # one string per row plus color runs (row, start, length, color)
+        if self.cols == 0:
+            return [""] * self.rows, np.empty((0, 4), dtype=np.int64)
+        lines = self.glyphs().view(f"U{self.cols}")[:, 0].tolist()
+        # empty cells always take the default color
+        runs = fast_find_runs(np.where(self.buffer != 0, self.colors, 0))
+        return lines, runs
+
+def warm_up():
+    # compiles every kernel a frame uses with the argument types main passes
+    # them, or loads them from numba's on disk cache (__pycache__). main runs
+    # this next to the base layer load so the first map frame doesnt stall
+    from simplify import simplify_lines
+    buf = BrailleBuffer(8, 8)
+    coords = np.array([[0.0, 0.0], [1.0, 1.0]])
+    # tile.lod simplifies on first use, 3 points so it has something to drop
+    bent = np.array([[0.0, 0.0], [1.0, 0.001], [2.0, 0.0]])
+    for writeable in (True, False):
+        # tiles read back from bytes come as read only views, another signature
+        offsets = np.array([0, 2], dtype=np.int32)
+        color, z_index = np.ones(1, dtype=np.uint8), np.ones(1, dtype=np.uint8)
+        bent_offsets = np.array([0, 3], dtype=np.int32)
+        for arr in (coords, offsets, color, z_index, bent, bent_offsets): arr.flags.writeable = writeable
+        simplify_lines(bent, bent_offsets, 0.01)
+        lines = type("Lines", (), {'coords': coords, 'offsets': offsets, 'color': color, 'z_index': z_index})
+        buf.draw_lines(lines, [0], 0.0, 0.0, 1.0, 2.0, 1, 1)
+        buf.draw_features(lines, [0], 0.0, 0.0, 1.0, 2.0)
+        # clipped draws go through non contiguous views of the buffer
+        buf.draw_features(lines, [0], 0.0, 0.0, 1.0, 2.0, clip=(1, 0, 3, 2))
+        coords, bent = coords.copy(), bent.copy()
+    buf.draw_polyline(coords, 0.0, 0.0, 1.0, 2.0, 1, 1)
+    buf.frame()
+    fast_find_runs(np.zeros((1, 1), dtype=np.int64))
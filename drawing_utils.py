@@ -68,70 +68,12 @@ def mercator_unproject(y_proj):
     return math.degrees(lat_rad)
 
 def draw_line_braille(buffer, x0, y0, x1, y1, color, z_index=0):
-    # bresenham adapted for the buffer
-    x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
-    
-    dx = abs(x1 - x0)
-    dy = abs(y1 - y0)
-    sx = 1 if x0 < x1 else -1
-    sy = 1 if y0 < y1 else -1
-    err = dx - dy
-
-    while True:
-        buffer.set_pixel(x0, y0, color, z_index)
-        
-        if x0 == x1 and y0 == y1: break
-        e2 = 2 * err
-        if e2 > -dy:
-            err -= dy
-            x0 += sx
-        if e2 < dx:
-            err += dx
-            y0 += sy
+    # bresenham runs inside the buffer kernel
+    buffer.draw_line(x0, y0, x1, y1, color, z_index)
 
 def draw_projected_polyline_braille(buffer, coords, cam_x, cam_y, zoom, aspect_ratio, width, height, color, z_index=0):
-    cx, cy = width // 2, height // 2
-    screen_points = []
-    
-    for mx, my in coords:
-        tx = mx - cam_x
-        ty = my - cam_y
-        sx = (tx * zoom * aspect_ratio * 2) + cx
-        sy = (-ty * zoom * 4) + cy
-        screen_points.append((int(sx), int(sy)))
-
-    for i in range(len(screen_points) - 1):
-        p1 = screen_points[i]
-        p2 = screen_points[i+1]
-        
-        # bounds
-        if (0 <= p1[0] < width or 0 <= p1[1] < height):
-             draw_line_braille(buffer, p1[0], p1[1], p2[0], p2[1], color, z_index)
-
-def simplify_polyline(coords_mx_my, tolerance_mx_my):
-    if not coords_mx_my:
-        return []
-    
-    simplified = [coords_mx_my[0]]
-    last_point = coords_mx_my[0]
-    
-    tolerance_sq = tolerance_mx_my * tolerance_mx_my
-    
-    for i in range(1, len(coords_mx_my)):
-        current_point = coords_mx_my[i]
-        
-        dx = current_point[0] - last_point[0]
-        dy = current_point[1] - last_point[1]
-        dist_sq = dx*dx + dy*dy
-        
-        if dist_sq >= tolerance_sq:
-            simplified.append(current_point)
-            last_point = current_point
-            
-    if simplified[-1] != coords_mx_my[-1]:
-        simplified.append(coords_mx_my[-1])
-        
-    return simplified
+    # projection + rasterization in one compiled call
+    buffer.draw_polyline(coords, cam_x, cam_y, zoom, aspect_ratio, color, z_index)
 
 
 def draw_menu(stdscr, title, options):
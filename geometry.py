@@ -0,0 +1,236 @@
+import copy
+import math
+import numpy as np
+from spatial import GridIndex
+from simplify import simplify_lines
+
+# feature kinds
+ROAD = 0
+BUILDING = 1
+LABEL = 2
+
+kind_names = ['road', 'building', 'label']
+
+# lines/rings packed into one (n, 2) mercator array, line i is
+# coords[offsets[i]:offsets[i+1]]
+class PackedLines:
+    def __init__(self, coords, offsets, bbox=None, index=None):
+        self.coords = np.ascontiguousarray(coords, dtype=np.float64).reshape(-1, 2)
+        self.offsets = np.ascontiguousarray(offsets, dtype=np.int32)
+        self.bbox = line_bboxes(self.coords, self.offsets) if bbox is None else bbox
+        self.index = GridIndex(self.bbox) if index is None else index
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, i):
+        return self.coords[self.offsets[i]:self.offsets[i + 1]]
+
+    def query(self, min_x, min_y, max_x, max_y):
+        return self.index.query(min_x, min_y, max_x, max_y)
+
+    @property
+    def nbytes(self):
+        index = self.index.items.nbytes + self.index.starts.nbytes if self.index.nx else 0
+        return self.coords.nbytes + self.offsets.nbytes + self.bbox.nbytes + index
+
+def line_bboxes(coords, offsets):
+    # (min_x, min_y, max_x, max_y) per line, empty lines are skipped by reduceat
+    n = len(offsets) - 1
+    bbox = np.zeros((n, 4), dtype=np.float64)
+    if n == 0 or len(coords) == 0: return bbox
+    starts = offsets[:-1]
+    full = offsets[1:] > starts
+    if not full.any(): return bbox
+    s = starts[full]
+    bbox[full, :2] = np.minimum.reduceat(coords, s, axis=0)
+    bbox[full, 2:] = np.maximum.reduceat(coords, s, axis=0)
+    return bbox
+
+def pack_lines(lines):
+    lines = [np.asarray(l, dtype=np.float64).reshape(-1, 2) for l in lines]
+    offsets = np.zeros(len(lines) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(l) for l in lines])
+    coords = np.concatenate(lines) if lines else np.empty((0, 2))
+    return coords, offsets
+
+# a base layer (borders, NE roads) kept at several douglas-peucker
+# tolerances. every level has the same lines in the same order, so they all
+# share the bboxes and spatial index of the full resolution one
+class LodLayer:
+    tolerances = (0.0, 0.002, 0.008, 0.032, 0.128)
+
+    def __init__(self, coords, offsets, tolerances=None):
+        self.tolerances = tuple(tolerances or self.tolerances)
+        full = PackedLines(coords, offsets)
+        self.levels = [full]
+        for tol in self.tolerances[1:]:
+            c, o = simplify_lines(full.coords, full.offsets, tol)
+            self.levels.append(PackedLines(c, o, bbox=full.bbox, index=full.index))
+
+    @classmethod
+    def from_lines(cls, lines, tolerances=None):
+        return cls(*pack_lines(lines), tolerances=tolerances)
+
+    def to_arrays(self, prefix):
+        # flat {name: array} of every level, for np.savez
+        out = {f"{prefix}_tolerances": np.array(self.tolerances), f"{prefix}_bbox": self.levels[0].bbox}
+        for i, level in enumerate(self.levels):
+            out[f"{prefix}_coords_{i}"] = level.coords
+            out[f"{prefix}_offsets_{i}"] = level.offsets
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        # inverse of to_arrays, nothing gets simplified again
+        layer = cls.__new__(cls)
+        layer.tolerances = tuple(arrays[f"{prefix}_tolerances"].tolist())
+        full = PackedLines(arrays[f"{prefix}_coords_0"], arrays[f"{prefix}_offsets_0"], bbox=arrays[f"{prefix}_bbox"])
+        layer.levels = [full] + [
+            PackedLines(arrays[f"{prefix}_coords_{i}"], arrays[f"{prefix}_offsets_{i}"], bbox=full.bbox, index=full.index)
+            for i in range(1, len(layer.tolerances))]
+        return layer
+
+    def __len__(self):
+        return len(self.levels[0])
+
+    def level_for(self, zoom):
+        # coarsest level whose error stays under half a braille pixel
+        half_pixel = 0.5 / (zoom * 4)
+        level = self.levels[0]
+        for tol, lines in zip(self.tolerances, self.levels):
+            if tol <= half_pixel: level = lines
+        return level
+
+    def query(self, min_x, min_y, max_x, max_y):
+        return self.levels[0].query(min_x, min_y, max_x, max_y)
+
+    @property
+    def nbytes(self):
+        # level 0 counts its own arrays plus the shared bboxes and index
+        return sum(l.coords.nbytes + l.offsets.nbytes for l in self.levels[1:]) + self.levels[0].nbytes
+
+# one processed vector tile: packed geometry + parallel feature columns,
+# strings live in a side table (names) and are referenced by index
+class PackedTile(PackedLines):
+    def __init__(self, coords, offsets, kind, cls, color, z_index, rank, name, names, bbox=None):
+        super().__init__(coords, offsets, bbox)
+        self.kind = kind        # uint8, ROAD / BUILDING / LABEL
+        self.cls = cls          # int32 into names, -1 for none
+        self.color = color      # uint8 braille color index
+        self.z_index = z_index  # uint8 draw priority
+        self.rank = rank        # uint8 label priority
+        self.name = name        # int32 into names, -1 for none
+        self.names = names
+        self.lods = {}          # zoom bucket -> simplified copy
+
+    @classmethod
+    def empty(cls):
+        return TileBuilder().build()
+
+    @property
+    def nbytes(self):
+        cols = self.kind.nbytes + self.cls.nbytes + self.color.nbytes + self.z_index.nbytes + self.rank.nbytes + self.name.nbytes
+        lods = sum(t.coords.nbytes + t.offsets.nbytes for t in list(self.lods.values()) if t is not self)
+        return super().nbytes + cols + lods + sum(len(n) + 49 for n in self.names)
+
+    def to_bytes(self):
+        # the whole tile as one flat buffer, cheap to pickle between processes.
+        # float64 columns go first so they stay aligned. names are stored
+        # length prefixed, they can hold anything
+        names = [n.encode("utf-8") for n in self.names]
+        lengths = np.array([len(n) for n in names], dtype=np.int32)
+        header = np.array([len(self.offsets), len(self.coords), len(names)], dtype=np.int64)
+        parts = (header, self.coords, self.bbox, self.offsets, self.cls, self.name, lengths,
+                 self.kind, self.color, self.z_index, self.rank)
+        return b"".join([np.ascontiguousarray(p).tobytes() for p in parts] + names)
+
+    @classmethod
+    def from_bytes(cls, data):
+        # arrays are read only views into data, nothing is copied
+        n_off, n_coords, n_names = (int(v) for v in np.frombuffer(data, dtype=np.int64, count=3))
+        n = n_off - 1
+        pos = 24
+        def take(dtype, count):
+            nonlocal pos
+            arr = np.frombuffer(data, dtype=dtype, count=count, offset=pos)
+            pos += arr.nbytes
+            return arr
+        coords = take(np.float64, n_coords * 2).reshape(-1, 2)
+        bbox = take(np.float64, n * 4).reshape(-1, 4)
+        offsets = take(np.int32, n_off)
+        cls_ = take(np.int32, n)
+        name = take(np.int32, n)
+        ends = np.cumsum(take(np.int32, n_names)).tolist()
+        kind, color, z_index, rank = (take(np.uint8, n) for _ in range(4))
+        blob = bytes(data[pos:pos + (ends[-1] if ends else 0)])
+        names = [blob[a:b].decode("utf-8") for a, b in zip([0] + ends[:-1], ends)]
+        return cls(coords, offsets, kind, cls_, color, z_index, rank, name, names, bbox=bbox)
+
+    def lod(self, zoom):
+        # geometry simplified to half a braille pixel at the top of zoom's
+        # power of two bucket, built once per bucket
+        bucket = int(math.floor(math.log2(max(zoom, 1e-9))))
+        tile = self.lods.get(bucket)
+        if tile is None:
+            tile = self.simplified(0.5 / (4 * 2.0 ** (bucket + 1)))
+            self.lods[bucket] = tile
+        return tile
+
+    def simplified(self, tolerance):
+        coords, offsets = simplify_lines(self.coords, self.offsets, tolerance)
+        if len(coords) == len(self.coords): return self
+        # same features, ids, bboxes and index, just fewer vertices
+        tile = copy.copy(self)
+        tile.coords, tile.offsets, tile.lods = coords, offsets, {}
+        return tile
+
+    def label(self, i):
+        # dict view of one feature for the label placer
+        f = {
+            'type': kind_names[self.kind[i]],
+            'name': self.names[self.name[i]] if self.name[i] >= 0 else '',
+            'rank': int(self.rank[i]),
+        }
+        if self.kind[i] == LABEL:
+            f['coords'] = tuple(self.coords[self.offsets[i]])
+        else:
+            f['coords'] = self.line(i)
+        return f
+
+class TileBuilder:
+    def __init__(self):
+        self.lines = []
+        self.columns = []  # (kind, cls, color, z_index, rank, name) per feature
+        self.names = []
+        self.name_ids = {}
+
+    def intern(self, s):
+        if not s: return -1
+        if s not in self.name_ids:
+            self.name_ids[s] = len(self.names)
+            self.names.append(s)
+        return self.name_ids[s]
+
+    def add(self, kind, coords, cls='', color=0, z_index=0, rank=0, name=''):
+        coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+        if kind == BUILDING and len(coords) and not np.array_equal(coords[0], coords[-1]):
+            # close rings here so the rasterizer doesnt have to
+            coords = np.vstack([coords, coords[:1]])
+        self.lines.append(coords)
+        self.columns.append((kind, self.intern(cls), color, z_index, rank, self.intern(name)))
+
+    def build(self, tolerance=0.0):
+        coords, offsets = pack_lines(self.lines)
+        coords, offsets = simplify_lines(coords, offsets, tolerance)
+        cols = np.array(self.columns, dtype=np.int32).reshape(-1, 6)
+        return PackedTile(
+            coords, offsets,
+            kind=cols[:, 0].astype(np.uint8),
+            cls=cols[:, 1].copy(),
+            color=cols[:, 2].astype(np.uint8),
+            z_index=cols[:, 3].astype(np.uint8),
+            rank=cols[:, 4].astype(np.uint8),
+            name=cols[:, 5].copy(),
+            names=self.names,
+        )
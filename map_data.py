@@ -4,16 +4,20 @@ import os
 import threading
 import time
 import math
-from shapely.geometry import shape
-from shapely.ops import unary_union
-import geopandas as gpd
-import pandas as pd
 import tempfile
 import zipfile
 import shutil
-import concurrent.futures
+import heapq
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from drawing_utils import *
 from tiles import *
+from geometry import *
+from projection import *
+
+# shapely, pandas and geopandas are only imported inside the functions
+# that parse the raw downloads, a warm start never needs them
 
 # download urls
 country_borders = "https://d2ad6b4ur7yvpq.cloudfront.net/naturalearth-3.3.0/ne_50m_admin_0_countries.geojson"
@@ -23,51 +27,235 @@ roads_zip = "https://naturalearth.s3.amazonaws.com/10m_cultural/ne_10m_roads.zip
 # cache files
 borders_cache = "cache_borders.json"
 cities_cache = "cache_cities.json"
-roads_cache = "cache_roads.pkl"
+roads_cache = "cache_roads.npz"
+legacy_roads_cache = "cache_roads.pkl"
+
+# borders, roads and cities after processing, as flat projected arrays.
+# bump the version whenever what goes in there changes
+base_snapshot = "cache_base.npz"
+snapshot_version = 1
+
+# memory budget for processed tiles, in bytes
+tile_memory_budget = 64 * 1024 * 1024
+
+# seconds before a tile whose fetch failed is asked for again
+tile_retry_after = 15.0
+
+# decode + process tiles in this many worker processes instead of on the
+# fetch threads, 0 keeps everything in process
+tile_process_workers = int(os.environ.get("CARTOASCII_TILE_PROCESSES", 0))
+
+# bump whenever build_tile's output changes, processed tiles on disk from
+# older versions are then ignored and age out of the store
+tile_processing_version = 3
 
 class TileManager:
-    def __init__(self, max_cache_size=200):
-        self.tiles = {}  # {(z, x, y): [features]}
+    def __init__(self, memory_budget=tile_memory_budget):
+        self.tiles = {}  # {(z, x, y): PackedTile}
         self.lock = threading.Lock()
-        self.max_cache_size = max_cache_size
-        self.requested_tiles = set() 
+        self.memory_budget = memory_budget
+        self.generation = 0 # bumps whenever the drawable tile set changes
+        self.failed = {}  # {(z, x, y): monotonic time} empty because the fetch failed
 
-    def get_tile(self, z, x, y):
-        return self.tiles.get((z, x, y))
+        # eviction bookkeeping
+        self.sizes = {}      # {(z, x, y): bytes}
+        self.last_used = {}  # {(z, x, y): monotonic time}
+        self.bytes_used = 0
+        self.camera = (0.0, 0.0)
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    def add_tile(self, z, x, y, features):
+    def set_camera(self, cam_x, cam_y):
+        self.camera = (cam_x, cam_y)
+
+    def get_tile(self, z, x, y):
+        tile = self.tiles.get((z, x, y))
+        if tile is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.last_used[(z, x, y)] = time.monotonic()
+        return tile
+
+    def eviction_score(self, key, now):
+        # higher goes first: seconds since last use + distance from the
+        # camera measured in tiles of the tile's own zoom
+        z, x, y = key
+        cx, cy = tile_to_mercator(z, x, y, 2048, 2048)
+        tile_size = 360.0 / (2 ** z)
+        dist = math.hypot(cx - self.camera[0], cy - self.camera[1]) / tile_size
+        return (now - self.last_used.get(key, now)) + 2.0 * dist
+
+    def add_tile(self, z, x, y, features, failed=False):
+        # failed tiles still get stored (empty) so they arent refetched every
+        # frame, the renderer draws stand ins for them like for missing ones
+        # and asks for them again after tile_retry_after
         with self.lock:
-            # simple eviction
-            if len(self.tiles) > self.max_cache_size:
-                try:
-                    for _ in range(5):
-                        self.tiles.pop(next(iter(self.tiles)))
-                except KeyError:
-                    pass
-            self.tiles[(z, x, y)] = features
-            if (z, x, y) in self.requested_tiles:
-                self.requested_tiles.remove((z, x, y))
-
-    def is_fetching(self, z, x, y):
+            key = (z, x, y)
+            if key in self.tiles:
+                self.bytes_used -= self.sizes[key]
+            if failed: self.failed[key] = time.monotonic()
+            else: self.failed.pop(key, None)
+            self.tiles[key] = features
+            self.sizes[key] = features.nbytes
+            self.last_used[key] = time.monotonic()
+            self.bytes_used += self.sizes[key]
+
+            if self.bytes_used > self.memory_budget:
+                self.evict(keep=key)
+
+            self.generation += 1
+
+    def fallback(self, z, x, y):
+        # loaded tiles that can stand in for a missing one: the nearest
+        # loaded ancestor, else whichever loaded descendants cover it
+        now = time.monotonic()
+        for pz in range(z - 1, -1, -1):
+            key = (pz, x >> (z - pz), y >> (z - pz))
+            if len(self.tiles.get(key, ())):
+                self.last_used[key] = now
+                return [key]
         with self.lock:
-            return (z, x, y) in self.requested_tiles
-
-    def mark_fetching(self, z, x, y):
+            keys = [k for k, t in self.tiles.items() if k[0] > z and len(t)
+                    and (k[1] >> (k[0] - z), k[2] >> (k[0] - z)) == (x, y)]
+        for key in keys: self.last_used[key] = now
+        return keys
+
+    def evict(self, keep):
+        # sizes grow as tiles build their zoom lods, refresh them first
+        for key, tile in self.tiles.items():
+            self.sizes[key] = tile.nbytes
+        self.bytes_used = sum(self.sizes.values())
+
+        now = time.monotonic()
+        victims = sorted((k for k in self.tiles if k != keep),
+                         key=lambda k: self.eviction_score(k, now), reverse=True)
+        for key in victims:
+            if self.bytes_used <= self.memory_budget: break
+            self.tiles.pop(key)
+            self.bytes_used -= self.sizes.pop(key)
+            self.last_used.pop(key, None)
+            self.failed.pop(key, None)
+            self.evictions += 1
+
+    def stats(self):
         with self.lock:
-            self.requested_tiles.add((z, x, y))
+            return {
+                'tiles': len(self.tiles),
+                'bytes': self.bytes_used,
+                'budget': self.memory_budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def has_tile(self, z, x, y):
+        return (z, x, y) in self.tiles
+
+    def retry_due(self, z, x, y):
+        # failed long enough ago to be worth fetching again
+        failed_at = self.failed.get((z, x, y))
+        return failed_at is not None and time.monotonic() - failed_at >= tile_retry_after
+
+class TileFetcher:
+    # priority queue of wanted tiles (lower = sooner) served by a few worker
+    # threads. want() replaces the whole wanted set each frame, so tiles
+    # that scrolled away are dropped when they come up instead of fetched
+    def __init__(self, tile_manager, workers=tile_fetch_workers, process=None):
+        self.tile_manager = tile_manager
+        self.process = process or process_single_tile
+        self.cond = threading.Condition()
+        self.queue = []      # heap of (priority, seq, key), may hold stale entries
+        self.wanted = {}     # {key: priority}
+        self.in_flight = set()
+        self.seq = 0
+        self.running = True
+
+        # counters
+        self.fetched = 0
+        self.cancelled = 0
+
+        self.threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(workers)]
+        for t in self.threads: t.start()
+
+    def want(self, tiles):
+        # tiles is [((z, x, y), priority)], anything else queued is cancelled
+        with self.cond:
+            old = self.wanted
+            self.wanted = {}
+            for key, priority in tiles:
+                # failed tiles are loaded (empty) but come due again after a while
+                if key in self.in_flight: continue
+                if self.tile_manager.has_tile(*key) and not self.tile_manager.retry_due(*key): continue
+                if key in self.wanted and self.wanted[key] <= priority: continue
+                self.wanted[key] = priority
+                if old.get(key) != priority:
+                    self.seq += 1
+                    heapq.heappush(self.queue, (priority, self.seq, key))
+            self.cancelled += sum(1 for key in old if key not in self.wanted)
+
+            # drop stale heap entries once they pile up
+            if len(self.queue) > 4 * len(self.wanted) + 64:
+                self.queue = [e for e in self.queue if self.wanted.get(e[2]) == e[0]]
+                heapq.heapify(self.queue)
+            self.cond.notify_all()
+
+    def next_tile(self):
+        with self.cond:
+            while self.running:
+                while self.queue:
+                    priority, _, key = heapq.heappop(self.queue)
+                    if self.wanted.get(key) == priority:
+                        del self.wanted[key]
+                        self.in_flight.add(key)
+                        return key
+                self.cond.wait()
+        return None
+
+    def worker(self):
+        while True:
+            key = self.next_tile()
+            if key is None: return
+            try:
+                features, failed = self.process(*key), False
+            except Exception:
+                features, failed = PackedTile.empty(), True
+            self.tile_manager.add_tile(*key, features, failed)
+            with self.cond:
+                self.in_flight.discard(key)
+                self.fetched += 1
+
+    def pending(self):
+        with self.cond:
+            return len(self.wanted) + len(self.in_flight)
+
+    def stats(self):
+        with self.cond:
+            return {
+                'queued': len(self.wanted),
+                'in_flight': len(self.in_flight),
+                'fetched': self.fetched,
+                'cancelled': self.cancelled,
+            }
 
-    def has_pending_downloads(self):
-        with self.lock:
-            return len(self.requested_tiles) > 0
+    def shutdown(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
 
 class mapData:
     def __init__(self):
-        self.projected_map_full = []
-        self.roads_data = []
+        self.borders = None  # LodLayer
+        self.roads = None    # LodLayer
         self.countries_coords = []
         self.data_loaded = False
         self.status = "Initializing..."
         self.progress = 0.0
+        self.loading = {}      # base layer -> fraction loaded
+        self.load_errors = {}  # base layer -> why it failed
         
         # routing stuff
         self.start_marker = None 
@@ -81,44 +269,48 @@ class mapData:
         self.address_lock = threading.Lock()
 
         self.tile_manager = TileManager()
-        self.fetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.tile_pool = None
+        process = None
+        if tile_process_workers > 0:
+            # spawn so the children dont inherit our threads or curses
+            self.tile_pool = ProcessPoolExecutor(tile_process_workers, mp_context=multiprocessing.get_context("spawn"))
+            process = lambda z, x, y: PackedTile.from_bytes(self.tile_pool.submit(process_tile_bytes, z, x, y).result())
+        self.fetcher = TileFetcher(self.tile_manager, process=process)
+
+        # bumps on route/marker/base layer changes
+        self.generation = 0
+
+    def touch(self):
+        self.generation += 1
+
+    def scene_generation(self):
+        # failed tiles come due for a retry without anything else changing,
+        # so while there are any the scene goes stale every retry period
+        retry = int(time.monotonic() // tile_retry_after) if self.tile_manager.failed else 0
+        return (self.generation, self.tile_manager.generation, retry)
+
+    def set_route(self, start_marker, end_marker, route_poly, instructions, mode):
+        self.start_marker = start_marker
+        self.end_marker = end_marker
+        self.route_poly = route_poly
+        self.route_instructions = instructions
+        self.active_mode = mode
+        self.touch()
+
+    def clear_route(self):
+        self.set_route(None, None, [], [], "VIEW")
+
+    def cache_stats(self):
+        # every cache layer in one place, memory and disk
+        return dict(cache_stats(), tiles=self.tile_manager.stats(), fetch=self.fetcher.stats())
 
     def shutdown(self):
-        self.fetch_executor.shutdown(wait=False)
-
-class FastCoordinateTransformer:
-    def __init__(self, z, x, y, extent=4096):
-        self.n = 2.0 ** z
-        self.x_offset = x
-        self.y_offset = y
-        self.extent = extent
-        self.pi = math.pi
-        self.mercator_const = 85.051129
-
-    def tile_to_mercator(self, px, py):
-        lon_deg = (self.x_offset + px / self.extent) / self.n * 360.0 - 180.0
-        
-        val = self.pi * (1 - 2 * (self.y_offset + py / self.extent) / self.n)
-        lat_rad = math.atan(math.sinh(val))
-        lat_deg = math.degrees(lat_rad)
-
-        if lat_deg > self.mercator_const: lat_deg = self.mercator_const
-        if lat_deg < -self.mercator_const: lat_deg = -self.mercator_const
-        
-        mx = lon_deg
-        lat_rad = math.radians(lat_deg)
-        my = math.log(math.tan((self.pi / 4) + (lat_rad / 2)))
-        my = math.degrees(my)
-        
-        return mx, my
+        self.fetcher.shutdown()
+        if self.tile_pool: self.tile_pool.shutdown(wait=False, cancel_futures=True)
 
 def process_ring(ring):
     if ring.is_empty: return []
-    coords = []
-    for lon, lat in ring.coords:
-        mx, my = mercator_project(lat, lon)
-        coords.append((mx, my))
-    return coords
+    return lonlat_coords_to_mercator(np.asarray(ring.coords)[:, :2])
 
 def geom_to_poly_list(geom):
     polys = []
@@ -130,7 +322,8 @@ def geom_to_poly_list(geom):
     return polys
 
 def download_borders(data_obj):
-    data_obj.status = "Fetching Borders..."
+    from shapely.geometry import shape
+    from shapely.ops import unary_union
     if os.path.exists(borders_cache):
         try:
             with open(borders_cache, 'r') as f: geojson = json.load(f)
@@ -158,18 +351,52 @@ def download_borders(data_obj):
     for geom in countries.values():
         polys = geom_to_poly_list(geom)
         for poly in polys:
-            if not poly: continue
-            xs = [p[0] for p in poly]
-            ys = [p[1] for p in poly]
-            bbox = (min(xs), min(ys), max(xs), max(ys))
+            if len(poly) == 0: continue
+            bbox = tuple(poly.min(axis=0).tolist() + poly.max(axis=0).tolist())
             projected_map.append({'bbox': bbox, 'geom': poly})
 
     return projected_map
 
+def ingest_roads(shp_path):
+    # ne_10m_roads shapefile -> (mercator coords, offsets), one line per
+    # linestring part. all array ops, no per row or per vertex python
+    import shapely
+    import geopandas as gpd
+    gdf = gpd.read_file(shp_path)
+    if 'scalerank' in gdf.columns:
+        gdf = gdf[gdf['scalerank'] <= 8]
+
+    parts = shapely.get_parts(gdf.geometry.values)
+    lonlat, part = shapely.get_coordinates(parts, return_index=True)
+    counts = np.bincount(part, minlength=len(parts))
+    counts = counts[counts > 0]  # empty parts have no coordinates to drop
+    offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    return lonlat_coords_to_mercator(lonlat), offsets
+
+def save_roads(coords, offsets, path=None):
+    path = path or roads_cache
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, coords=coords, offsets=offsets)
+    os.replace(tmp, path)
+
+def load_roads(path=None):
+    with np.load(path or roads_cache, allow_pickle=False) as f:
+        return f['coords'], f['offsets']
+
 def download_global_roads(data_obj):
-    data_obj.status = "Fetching Global Roads..."
+    # (coords, offsets) of every road, packed like geometry.pack_lines
     if os.path.exists(roads_cache):
-        try: return pd.read_pickle(roads_cache)
+        try: return load_roads()
+        except: pass
+    if os.path.exists(legacy_roads_cache):
+        # the old pickled list of {'bbox', 'geom'} dicts, repack it once
+        try:
+            import pandas as pd
+            coords, offsets = pack_lines([road['geom'] for road in pd.read_pickle(legacy_roads_cache)])
+            save_roads(coords, offsets)
+            os.remove(legacy_roads_cache)
+            return coords, offsets
         except: pass
 
     try:
@@ -182,75 +409,154 @@ def download_global_roads(data_obj):
             for chunk in resp.iter_content(4096):
                 dl += len(chunk)
                 f.write(chunk)
-                if total: data_obj.progress = 20 + int((dl/total)*30)
+                # the download is most of the work
+                if total: layer_progress(data_obj, 'roads', 0.8 * dl / total)
         
         tmp_dir = tempfile.mkdtemp()
         with zipfile.ZipFile(tmp_zip, 'r') as z: z.extractall(tmp_dir)
         
         shp = [x for x in os.listdir(tmp_dir) if x.endswith('.shp')][0]
-        gdf = gpd.read_file(os.path.join(tmp_dir, shp))
-        
-        if 'scalerank' in gdf.columns:
-            gdf = gdf[gdf['scalerank'] <= 8]
-
-        processed_roads = []
-        for _, row in gdf.iterrows():
-            geom = row['geometry']
-            parts = geom.geoms if geom.geom_type == 'MultiLineString' else [geom]
-            for part in parts:
-                coords = []
-                for lon, lat in part.coords:
-                    mx, my = mercator_project(lat, lon)
-                    coords.append((mx, my))
-                if coords:
-                    xs, ys = zip(*coords)
-                    bbox = (min(xs), min(ys), max(xs), max(ys))
-                    processed_roads.append({'bbox': bbox, 'geom': coords})
-
-        pd.to_pickle(processed_roads, roads_cache)
+        coords, offsets = ingest_roads(os.path.join(tmp_dir, shp))
+        save_roads(coords, offsets)
         shutil.rmtree(tmp_dir, ignore_errors=True)
         if os.path.exists(tmp_zip): os.remove(tmp_zip)
-        return processed_roads
+        return coords, offsets
     except:
-        return []
-
-def load_initial_data(data_obj):
+        return pack_lines([])
+
+def snapshot_sources():
+    # size + mtime of the raw caches the snapshot was built from
+    out = []
+    for path in (borders_cache, roads_cache, cities_cache):
+        st = os.stat(path) if os.path.exists(path) else None
+        out += [st.st_size, st.st_mtime_ns] if st else [-1, -1]
+    return np.array(out, dtype=np.int64)
+
+def save_snapshot(data_obj, path=None):
+    # only once every source made it to disk, otherwise the next start
+    # should retry the downloads rather than reuse a partial snapshot
+    sources = snapshot_sources()
+    if (sources < 0).any(): return False
+    path = path or base_snapshot
+    cities = data_obj.countries_coords
+    arrays = dict(
+        version=np.array(snapshot_version),
+        sources=sources,
+        city_names=np.array([c['name'] for c in cities], dtype=str),
+        city_pop=np.array([c['pop'] for c in cities], dtype=np.float64),
+        city_coords=np.array([c['coords'] for c in cities], dtype=np.float64).reshape(-1, 2),
+        **data_obj.borders.to_arrays("borders"),
+        **data_obj.roads.to_arrays("roads"),
+    )
+    # write next to it and rename so a crash never leaves half a snapshot
+    tmp = path + ".tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+    return True
+
+def load_snapshot(data_obj, path=None):
+    # True if the base layers came from a current snapshot
+    path = path or base_snapshot
+    if not os.path.exists(path): return False
     try:
-        data_obj.projected_map_full = download_borders(data_obj)
-        data_obj.progress = 50.0
-        data_obj.roads_data = download_global_roads(data_obj)
-        data_obj.progress = 80.0
-
-        data_obj.status = "Fetching Cities..."
-        if os.path.exists(cities_cache):
-            with open(cities_cache, 'r') as f: c_data = json.load(f)
-        else:
-            c_data = requests.get(populated_places).json()
-            with open(cities_cache, 'w') as f: json.dump(c_data, f)
-
-        cities = []
-        if 'features' in c_data:
-            for feat in c_data['features']:
-                props = feat['properties']
-                pop = props.get('pop_max', props.get('POP_MAX', 0))
-                
-                if pop > 1000:
-                    lon, lat = feat['geometry']['coordinates']
-                    mx, my = mercator_project(lat, lon)
-                    cities.append({
-                        'name': props.get('name', 'Unknown'),
-                        'pop': pop,
-                        'coords': (mx, my)
-                    })
-        
-        data_obj.countries_coords = sorted(cities, key=lambda x: x['pop'], reverse=True)
-        data_obj.progress = 100.0
+        with np.load(path, allow_pickle=False) as f:
+            arrays = {k: f[k] for k in f.files}
+    except Exception:
+        return False
+    if int(arrays['version']) != snapshot_version: return False
+    if not np.array_equal(arrays['sources'], snapshot_sources()): return False
+
+    data_obj.borders = LodLayer.from_arrays(arrays, "borders")
+    data_obj.roads = LodLayer.from_arrays(arrays, "roads")
+    pops = arrays['city_pop'].tolist()
+    data_obj.countries_coords = [
+        {'name': name, 'pop': int(pop) if pop.is_integer() else pop, 'coords': (mx, my)}
+        for name, pop, (mx, my) in zip(arrays['city_names'].tolist(), pops, arrays['city_coords'].tolist())]
+    return True
+
+def download_cities(data_obj):
+    if os.path.exists(cities_cache):
+        with open(cities_cache, 'r') as f: c_data = json.load(f)
+    else:
+        c_data = requests.get(populated_places).json()
+        with open(cities_cache, 'w') as f: json.dump(c_data, f)
+
+    cities = []
+    city_lonlat = []
+    if 'features' in c_data:
+        for feat in c_data['features']:
+            props = feat['properties']
+            pop = props.get('pop_max', props.get('POP_MAX', 0))
+            
+            if pop > 1000:
+                city_lonlat.append(feat['geometry']['coordinates'][:2])
+                cities.append({
+                    'name': props.get('name', 'Unknown'),
+                    'pop': pop,
+                })
+
+    # project all of them in one go
+    for city, (mx, my) in zip(cities, lonlat_coords_to_mercator(city_lonlat).tolist()):
+        city['coords'] = (mx, my)
+    return sorted(cities, key=lambda x: x['pop'], reverse=True)
+
+# base layers: (name, mapData attribute, loader, share of the progress bar)
+base_layers = (
+    ('borders', 'borders', lambda d: LodLayer.from_lines([item['geom'] for item in download_borders(d)]), 0.4),
+    ('roads', 'roads', lambda d: LodLayer(*download_global_roads(d)), 0.4),
+    ('cities', 'countries_coords', download_cities, 0.2),
+)
+
+def layer_progress(data_obj, layer, frac):
+    # progress and status from every layer's own fraction
+    data_obj.loading[layer] = frac
+    data_obj.progress = 100.0 * sum(share * data_obj.loading.get(name, 0.0) for name, _, _, share in base_layers)
+    waiting = [name for name, _, _, _ in base_layers if data_obj.loading.get(name, 0.0) < 1.0]
+    if data_obj.load_errors:
+        data_obj.status = "Error: " + "; ".join(f"{k}: {v}" for k, v in data_obj.load_errors.items())
+    elif waiting:
+        data_obj.status = f"Loading {', '.join(waiting)}..."
+    else:
         data_obj.status = "Ready"
-        data_obj.data_loaded = True
 
-    except Exception as e:
-        data_obj.status = f"Error: {str(e)}"
+def load_initial_data(data_obj):
+    # warm start, everything already processed
+    data_obj.status = "Loading snapshot..."
+    try: warm = load_snapshot(data_obj)
+    except Exception: warm = False
+    if warm:
+        for name, _, _, _ in base_layers: layer_progress(data_obj, name, 1.0)
         data_obj.data_loaded = True
+        data_obj.touch()
+        return
+
+    # otherwise all three at once, each shows up on the map as soon as its
+    # ready. borders are enough to start moving around, roads (a big zip
+    # on a fresh machine) and cities fill in later
+    publish = threading.Lock()
+    def load(name, attr, loader):
+        try:
+            value = loader(data_obj)
+            with publish:
+                setattr(data_obj, attr, value)
+                layer_progress(data_obj, name, 1.0)
+        except Exception as e:
+            with publish:
+                data_obj.load_errors[name] = str(e)
+                layer_progress(data_obj, name, 1.0)
+        with publish:
+            if name == 'borders': data_obj.data_loaded = True
+            data_obj.touch()
+
+    for name, _, _, _ in base_layers: layer_progress(data_obj, name, 0.0)
+    threads = [threading.Thread(target=load, args=(name, attr, loader), daemon=True)
+               for name, attr, loader, _ in base_layers]
+    for t in threads: t.start()
+    for t in threads: t.join()
+
+    if not data_obj.load_errors:
+        try: save_snapshot(data_obj)
+        except Exception: pass
 
 def sanitize_label(props):
     name = props.get('name:en', props.get('name', ''))
@@ -258,14 +564,26 @@ def sanitize_label(props):
 
 def process_single_tile(z, x, y):
     # downloads and processes a single tile
-    raw = fetch_and_decode_tile(z, x, y)
-    if not raw: return []
-
-    new_features = []
-    transformer = FastCoordinateTransformer(z, x, y)
-    
-    # tolerance for simplification
-    SIMPLIFY_TOL = 0.00005 
+    return PackedTile.from_bytes(process_tile_bytes(z, x, y))
+
+def process_tile_bytes(z, x, y):
+    # the processed tile as one flat buffer, straight from the store if an
+    # earlier session (or seed.py) already built it. also the process pool
+    # entry point
+    data = tile_store().get_processed(z, x, y, tile_processing_version)
+    if data is None:
+        raw = fetch_and_decode_tile(z, x, y)
+        # not stored, the download may work next time. raised so callers
+        # can tell it apart from a tile thats empty for real
+        if raw is None: raise IOError(f"tile {z}/{x}/{y} unavailable")
+        data = build_tile(z, x, y, raw).to_bytes()
+        tile_store().put_processed(z, x, y, tile_processing_version, data)
+        forget_tile(z, x, y)
+    return data
+
+def build_tile(z, x, y, raw):
+    # decoded mvt -> PackedTile
+    builder = TileBuilder()
 
     # roads
     if 'transportation' in raw:
@@ -293,29 +611,12 @@ def process_single_tile(z, x, y):
             elif f['geometry']['type'] != 'MultiLineString': continue
             
             for line in geoms:
-                coords = []
-                for px, py in line:
-                    mx, my = transformer.tile_to_mercator(px, py)
-                    coords.append((mx, my))
-                
-                # simplification
-                if len(coords) > 2:
-                    coords = simplify_polyline(coords, SIMPLIFY_TOL)
+                coords = tile_coords_to_mercator(z, x, y, line)
 
                 if len(coords) > 1:
-                    xs = [p[0] for p in coords]
-                    ys = [p[1] for p in coords]
-                    bbox = (min(xs), min(ys), max(xs), max(ys))
-                    
-                    new_features.append({
-                        'type': 'road', 
-                        'class': r_class,
-                        'color_idx': road_color,
-                        'z_index': road_priority,
-                        'name': name, 
-                        'coords': coords,
-                        'bbox': bbox
-                    })
+                    # road names go after places and pois when labels are placed
+                    builder.add(ROAD, coords, cls=r_class, color=road_color,
+                                z_index=road_priority, rank=99, name=name)
 
     # buildings
     if 'building' in raw:
@@ -326,26 +627,11 @@ def process_single_tile(z, x, y):
 
             for poly in geoms:
                 for ring in poly:
-                    coords = []
-                    for px, py in ring:
-                        mx, my = transformer.tile_to_mercator(px, py)
-                        coords.append((mx, my))
-                    
-                    # simplification stuff 
-                    if len(coords) > 4:
-                        coords = simplify_polyline(coords, SIMPLIFY_TOL)
+                    coords = tile_coords_to_mercator(z, x, y, ring)
                         
                     if len(coords) > 2:
-                        # Pre-calculate BBox
-                        xs = [p[0] for p in coords]
-                        ys = [p[1] for p in coords]
-                        bbox = (min(xs), min(ys), max(xs), max(ys))
-
-                        new_features.append({
-                            'type': 'building', 
-                            'coords': coords,
-                            'bbox': bbox
-                        })
+                        # Buildings = Z-index 2
+                        builder.add(BUILDING, coords, color=2, z_index=2)
     
     # cities, towns, settlements
     if 'place' in raw:
@@ -359,16 +645,8 @@ def process_single_tile(z, x, y):
                 
                 name = sanitize_label(props)
                 if name:
-                    px, py = f['geometry']['coordinates']
-                    mx, my = transformer.tile_to_mercator(px, py)
-                    bbox = (mx, my, mx, my)
-                    new_features.append({
-                        'type': 'label', 
-                        'name': name,
-                        'rank': 1, # High priority
-                        'coords': (mx, my),
-                        'bbox': bbox
-                    })
+                    coords = tile_coords_to_mercator(z, x, y, f['geometry']['coordinates'])
+                    builder.add(LABEL, coords, name=name, rank=1) # High priority
 
     # places of interests
     if 'poi' in raw:
@@ -383,25 +661,9 @@ def process_single_tile(z, x, y):
             if rank <= 10 or cls in ALLOWED_POI or sub in ALLOWED_POI:
                 name = sanitize_label(props)
                 if name:
-                    px, py = f['geometry']['coordinates']
-                    mx, my = transformer.tile_to_mercator(px, py)
-                    bbox = (mx, my, mx, my)
-                    new_features.append({
-                        'type': 'label',
-                        'name': name,
-                        'rank': 10, 
-                        'coords': (mx, my),
-                        'bbox': bbox
-                    })
-
-    return new_features
-
-def fetch_tiles_background(data_obj, tiles_to_fetch):
-    # worker function for tiles
-    for i, (z, x, y) in enumerate(tiles_to_fetch):
-        try:
-            features = process_single_tile(z, x, y)
-            data_obj.tile_manager.add_tile(z, x, y, features)
-            time.sleep(0.005)
-        except Exception as e:
-            data_obj.tile_manager.add_tile(z, x, y, [])
\ No newline at end of file
+                    coords = tile_coords_to_mercator(z, x, y, f['geometry']['coordinates'])
+                    builder.add(LABEL, coords, name=name, rank=10)
+
+    # drop what the tile itself cant resolve (one tile pixel), the
+    # zoom dependent simplification happens per tile in PackedTile.lod
+    return builder.build(tolerance=360.0 / (2 ** z) / 4096)
@@ -0,0 +1,125 @@
+import math
+import time
+from collections import deque
+from projection import mercator_to_lonlat
+from tiles import tiles_for_bbox
+from zoom_policy import ideal_tile_zoom, level_for, tile_levels
+
+# picks a few tiles the camera is about to need from how it has been
+# moving: ahead along a pan, or the next tile level when zooming
+
+# seconds of camera history the velocity is measured over
+velocity_window = 0.5
+
+# how far ahead (seconds at the current velocity) to prefetch
+lookahead = 1.0
+
+# most tiles to prefetch at once on top of the visible ones
+prefetch_budget = 12
+
+# prefetched tiles not seen within this many seconds count as wasted
+prefetch_expiry = 30.0
+
+def tiles_for_view(min_x, min_y, max_x, max_y, z):
+    # tiles_for_bbox wants lon/lat, the camera works in mercator
+    _, lat_min = mercator_to_lonlat(0.0, min_y)
+    _, lat_max = mercator_to_lonlat(0.0, max_y)
+    return tiles_for_bbox(min_x, float(lat_min), max_x, float(lat_max), z)
+
+class Prefetcher:
+    def __init__(self, budget=prefetch_budget, levels=tile_levels):
+        self.budget = budget
+        self.levels = levels
+        self.samples = deque()  # (t, cam_x, cam_y, log zoom)
+        self.zoom = 1.0
+
+        # hit rate bookkeeping
+        self.prefetched = {}    # {key: time requested}, not seen yet
+        self.issued = 0
+        self.hits = 0           # prefetched, then on screen
+        self.wasted = 0         # prefetched, never on screen
+        self.misses = 0         # on screen but missing and not prefetched
+        self.on_demand = set()  # keys currently counted as misses
+
+    def observe(self, cam_x, cam_y, zoom, now=None):
+        now = time.monotonic() if now is None else now
+        self.zoom = zoom
+        self.samples.append((now, cam_x, cam_y, math.log(zoom)))
+        while len(self.samples) > 2 and now - self.samples[0][0] > velocity_window:
+            self.samples.popleft()
+
+    def velocity(self):
+        # (mercator x/s, mercator y/s, log zoom/s) over the window
+        if len(self.samples) < 2: return 0.0, 0.0, 0.0
+        t0, x0, y0, z0 = self.samples[0]
+        t1, x1, y1, z1 = self.samples[-1]
+        dt = t1 - t0
+        if dt <= 0: return 0.0, 0.0, 0.0
+        return (x1 - x0) / dt, (y1 - y0) / dt, (z1 - z0) / dt
+
+    def plan(self, view, tile_z, aspect_ratio=2.0):
+        # [(key, rank)] of tiles to prefetch, best first. view is the
+        # visible mercator box, tiles in it arent included
+        min_x, min_y, max_x, max_y = view
+        vx, vy, vz = self.velocity()
+        visible = set(tiles_for_view(min_x, min_y, max_x, max_y, tile_z))
+        cx, cy = (min_x + max_x) / 2, (min_y + max_y) / 2
+        candidates = []
+
+        # panning: the view shifted to where it'll be in `lookahead` s
+        dx, dy = vx * lookahead, vy * lookahead
+        if dx or dy:
+            ahead = tiles_for_view(min(min_x, min_x + dx), min(min_y, min_y + dy),
+                                   max(max_x, max_x + dx), max(max_y, max_y + dy), tile_z)
+            candidates += [(key, self.distance(key, cx + dx, cy + dy)) for key in ahead if key not in visible]
+
+        # zooming: the level the policy will switch to, over the area
+        # that will still be on screen
+        if abs(vz) > 0.05:
+            future = self.zoom * math.exp(vz * lookahead)
+            level = level_for(ideal_tile_zoom(future, aspect_ratio), self.levels)
+            if level != tile_z:
+                s = min(self.zoom / future, 4.0) / 2
+                w, h = (max_x - min_x) * s, (max_y - min_y) * s
+                near = tiles_for_view(cx - w, cy - h, cx + w, cy + h, level)
+                candidates += [(key, self.distance(key, cx, cy)) for key in near]
+
+        candidates.sort(key=lambda c: c[1])
+        return [(key, rank) for rank, (key, _) in enumerate(candidates[:self.budget])]
+
+    @staticmethod
+    def distance(key, mx, my):
+        # from a tile's center to a mercator point, in tiles
+        z, x, y = key
+        n = 2.0 ** z
+        tx = (mx + 180.0) / 360.0 * n
+        ty = (180.0 - my) / 360.0 * n
+        return math.hypot(x + 0.5 - tx, y + 0.5 - ty)
+
+    def record(self, requested, visible_missing, visible, now=None):
+        # requested: prefetch keys handed to the fetcher this frame,
+        # visible_missing: on screen keys we had to fetch on demand,
+        # visible: every on screen key
+        now = time.monotonic() if now is None else now
+        for key in requested:
+            if key not in self.prefetched:
+                self.prefetched[key] = now
+                self.issued += 1
+        # a tile stays missing for a few frames while it loads, count it once
+        on_demand = {key for key in visible_missing if key not in self.prefetched}
+        self.misses += len(on_demand - self.on_demand)
+        self.on_demand = on_demand
+        for key in visible:
+            if self.prefetched.pop(key, None) is not None: self.hits += 1
+        for key in [k for k, t in self.prefetched.items() if now - t > prefetch_expiry]:
+            del self.prefetched[key]
+            self.wasted += 1
+
+    def stats(self):
+        return {
+            'issued': self.issued,
+            'hits': self.hits,
+            'wasted': self.wasted,
+            'misses': self.misses,
+            'hit_rate': self.hits / self.issued if self.issued else 0.0,
+        }
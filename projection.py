@@ -0,0 +1,45 @@
+import numpy as np
+
+# batch versions of the projection math, all take/return numpy arrays.
+# "mercator" here is the map's own space: x = lon, y = mercator y in degrees
+
+mercator_const = 85.051129
+
+# mercator y of the clamp latitude (~180)
+max_my = float(np.degrees(np.log(np.tan(np.pi / 4 + np.radians(mercator_const) / 2))))
+
+def lonlat_to_mercator(lon, lat):
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -mercator_const, mercator_const)
+    my = np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
+    return np.asarray(lon, dtype=np.float64), my
+
+def mercator_to_lonlat(mx, my):
+    lat = np.degrees(2 * (np.arctan(np.exp(np.radians(np.asarray(my, dtype=np.float64)))) - np.pi / 4))
+    return np.asarray(mx, dtype=np.float64), lat
+
+def tile_to_mercator(z, x, y, px, py, extent=4096):
+    # tile pixel -> lat -> mercator collapses to an affine map, the only
+    # non linear bit left is the latitude clamp
+    n = 2.0 ** z
+    mx = (x + np.asarray(px, dtype=np.float64) / extent) / n * 360.0 - 180.0
+    my = 180.0 - (y + np.asarray(py, dtype=np.float64) / extent) / n * 360.0
+    return mx, np.clip(my, -max_my, max_my)
+
+def mercator_to_tile(z, x, y, mx, my, extent=4096):
+    n = 2.0 ** z
+    px = ((np.asarray(mx, dtype=np.float64) + 180.0) / 360.0 * n - x) * extent
+    py = ((180.0 - np.asarray(my, dtype=np.float64)) / 360.0 * n - y) * extent
+    return px, py
+
+# (n, 2) array helpers for the ingest paths
+def lonlat_coords_to_mercator(coords):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    out = np.empty_like(coords)
+    out[:, 0], out[:, 1] = lonlat_to_mercator(coords[:, 0], coords[:, 1])
+    return out
+
+def tile_coords_to_mercator(z, x, y, coords, extent=4096):
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    out = np.empty_like(coords)
+    out[:, 0], out[:, 1] = tile_to_mercator(z, x, y, coords[:, 0], coords[:, 1], extent)
+    return out
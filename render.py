@@ -0,0 +1,334 @@
+import os
+import sys
+import time
+import math
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from braille import *
+from screen import ScreenBuffer
+from drawing_utils import LabelManager, mercator_project, draw_projected_polyline_braille
+from geometry import ROAD, BUILDING, LABEL, PackedTile
+from projection import mercator_to_tile, tile_to_mercator
+from zoom_policy import TileZoomPolicy
+from prefetch import tiles_for_view
+
+# the map without a terminal: camera + size + mapData in, a composed
+# ScreenBuffer (glyphs + attrs) out. main.py draws its hud on top and
+# sends it to curses, the cli below writes frames to files
+#   python render.py views.txt --size 160x48 --out frames
+# views.txt has one "lon lat zoom" per line
+
+# what the renderer writes into ScreenBuffer.attrs, filled in by a
+# palette. headless attrs are the color pair plus these flags
+BOLD = 1 << 8
+DIM = 1 << 9
+
+# name -> (color pair, flags), pairs as set up in main.py
+styles = {
+    'start_marker': (1, BOLD),
+    'end_marker': (4, BOLD),
+    'city_small': (3, DIM),
+    'city_mid': (4, 0),
+    'city_big': (4, BOLD),
+    'city_name': (3, DIM),
+    'road_label': (5, DIM),
+    'place_label': (2, BOLD),
+}
+
+# color pair -> ansi sgr, same colors main.py gives curses
+pair_ansi = {0: "0", 1: "32", 2: "36", 3: "37", 4: "31", 5: "33", 6: "34", 7: "30;47", 8: "35", 9: "37;40"}
+
+def make_palette(attr):
+    # attr(pair, flags) -> whatever ends up in ScreenBuffer.attrs
+    palette = {name: attr(pair, flags) for name, (pair, flags) in styles.items()}
+    # braille color index -> attr, empty cells use pair 3
+    palette['braille'] = np.array([attr(i or 3, 0) for i in range(256)], dtype=np.int64)
+    return palette
+
+def headless_palette():
+    return make_palette(lambda pair, flags: pair | flags)
+
+class Renderer:
+    def __init__(self, data, width, height, palette=None, tile_policy=None):
+        self.data = data
+        self.width = width
+        self.height = height
+        self.palette = palette or headless_palette()
+        self.buffer = BrailleBuffer(width * 2, height * 4)
+        self.screen = ScreenBuffer(width, height)
+        self.aspect_ratio = 2.0
+        # pass the old renderer's policy on a resize to keep its hysteresis
+        self.tile_policy = tile_policy or TileZoomPolicy()
+
+        # tiles of the last frame, main.py fetches from these
+        self.tile_z = None
+        self.in_view = []
+        self.missing = []   # [(key, priority)] not loaded yet
+
+    def to_screen(self, mx, my):
+        sx = ((mx - self.cam_x) * self.zoom * self.aspect_ratio) + self.width // 2
+        sy = (-(my - self.cam_y) * self.zoom) + self.height // 2
+        return int(sx), int(sy)
+
+    def from_screen(self, sx, sy):
+        mx = self.cam_x + (sx - self.width // 2) / (self.zoom * self.aspect_ratio)
+        my = self.cam_y - (sy - self.height // 2) / self.zoom
+        return mx, my
+
+    def view(self):
+        view_w = (self.width / self.aspect_ratio) / self.zoom
+        view_h = self.height / self.zoom
+        return (self.cam_x - view_w / 2, self.cam_y - view_h / 2,
+                self.cam_x + view_w / 2, self.cam_y + view_h / 2)
+
+    def render(self, cam_x, cam_y, zoom):
+        # the whole map for one camera, into self.screen
+        self.cam_x, self.cam_y, self.zoom = cam_x, cam_y, zoom
+        self.buffer.clear()
+        self.screen.clear()
+        self.draw_base_layers()
+        labels = self.draw_tiles()
+        self.screen.blit_braille(self.buffer, self.palette['braille'])
+        self.draw_markers()
+
+        label_manager = LabelManager(self.width, self.height)
+        self.draw_cities(label_manager)
+        self.draw_labels(labels, label_manager)
+        return self.screen
+
+    def draw_base_layers(self):
+        data, buffer = self.data, self.buffer
+        cam_x, cam_y, zoom, aspect_ratio = self.cam_x, self.cam_y, self.zoom, self.aspect_ratio
+        view = self.view()
+
+        # --- draw global borders ---
+        if zoom < 80.0 and data.borders:
+            # pick the simplification level that matches the zoom
+            layer = data.borders.level_for(zoom)
+            ids = data.borders.query(*view)
+            buffer.draw_lines(layer, ids, cam_x, cam_y, zoom, aspect_ratio, 1, z_index=1)
+
+        # --- draw global roads ---
+        if data.roads and 5.0 < zoom < 50.0:
+            layer = data.roads.level_for(zoom)
+            ids = data.roads.query(*view)
+            # Global Highways = High Priority (4)
+            buffer.draw_lines(layer, ids, cam_x, cam_y, zoom, aspect_ratio, 5, z_index=4)
+
+        # route post-routing
+        if len(data.route_poly):
+            # Route Line = Max Priority (8)
+            draw_projected_polyline_braille(buffer, data.route_poly, cam_x, cam_y, zoom, aspect_ratio,
+                                            buffer.width, buffer.height, 8, z_index=8)
+
+    def draw_tiles(self):
+        # vector tiles in view (or loaded stand ins), returns their labels
+        self.tile_z, self.in_view, self.missing = None, [], []
+        if self.zoom <= 20.0: return []
+        tile_manager = self.data.tile_manager
+        cam_x, cam_y, zoom, aspect_ratio = self.cam_x, self.cam_y, self.zoom, self.aspect_ratio
+        view = self.view()
+
+        tile_manager.set_camera(cam_x, cam_y)
+        self.tile_z = self.tile_policy.update(zoom, aspect_ratio)
+        self.in_view = tiles_for_view(*view, self.tile_z)
+
+        # fetch order: distance from the view center in tiles
+        center_x, center_y = mercator_to_tile(self.tile_z, 0, 0, cam_x, cam_y, extent=1)
+
+        labels = []
+        for z, x, y in self.in_view:
+            tile = tile_manager.get_tile(z, x, y)
+
+            if tile is None or tile_manager.retry_due(z, x, y):
+                priority = math.hypot(x + 0.5 - center_x, y + 0.5 - center_y)
+                self.missing.append(((z, x, y), priority))
+
+            if tile is None or (z, x, y) in tile_manager.failed:
+                # still loading (or failed), draw a loaded parent or
+                # children in its place, but only inside its own rect so
+                # they dont draw over the loaded neighbours
+                min_x, max_y = tile_to_mercator(z, x, y, 0, 0)
+                max_x, min_y = tile_to_mercator(z, x, y, 4096, 4096)
+                rect = (max(min_x, view[0]), max(min_y, view[1]), min(max_x, view[2]), min(max_y, view[3]))
+                clip = self.buffer.cells(*rect, cam_x, cam_y, zoom, aspect_ratio)
+                for key in tile_manager.fallback(z, x, y):
+                    self.draw_tile(tile_manager.tiles.get(key), rect, clip, labels)
+            else:
+                self.draw_tile(tile, view, None, labels)
+        return labels
+
+    def draw_tile(self, tile, rect, clip, labels):
+        # the tile's features inside rect (mercator), clip is the same rect
+        # in braille cells for stand ins, None for a tile drawn in full
+        if tile is None: return
+        cam_x, cam_y, zoom, aspect_ratio = self.cam_x, self.cam_y, self.zoom, self.aspect_ratio
+        ids = tile.query(*rect)
+        kinds = tile.kind[ids]
+
+        # roads use stored Z-index (2, 3 or 4), buildings 2
+        lines = kinds == ROAD
+        if zoom > 800: lines |= kinds == BUILDING
+        self.buffer.draw_features(tile.lod(zoom), ids[lines], cam_x, cam_y, zoom, aspect_ratio, clip)
+
+        labelled = kinds == LABEL
+        if zoom > 1500: labelled |= (kinds == ROAD) & (tile.name[ids] >= 0)
+        for i in ids[labelled].tolist():
+            labels.append(tile.label(i))
+
+    def draw_markers(self):
+        for marker, text, style in ((self.data.start_marker, "O", 'start_marker'), (self.data.end_marker, "X", 'end_marker')):
+            if not marker: continue
+            sx, sy = self.to_screen(*marker)
+            if 0 <= sx < self.width and 0 <= sy < self.height:
+                self.screen.addstr(sy, sx, text, self.palette[style])
+
+    def draw_cities(self, label_manager):
+        # draw cities (Natural Earth)
+        zoom, palette = self.zoom, self.palette
+        cities = self.data.countries_coords
+        if not cities or zoom >= 150.0: return
+        pop_cutoff = 0
+        if zoom < 8.0: pop_cutoff = 1_000_000
+        elif zoom < 30.0: pop_cutoff = 100_000
+        elif zoom < 100.0: pop_cutoff = 10_000
+
+        for city in cities:
+            if city['pop'] < pop_cutoff: break
+            sx, sy = self.to_screen(*city['coords'])
+            if 0 <= sy < self.height and 0 <= sx < self.width:
+                marker, style = '·', 'city_small'
+                if city['pop'] >= 1_000_000: marker, style = '◆', 'city_big'
+                elif city['pop'] >= 100_000: marker, style = '●', 'city_mid'
+                name_len = len(city['name'])
+                if label_manager.can_draw(sx, sy, name_len + 2):
+                    self.screen.addstr(sy, sx, marker, palette[style])
+                    if sx + 2 + name_len < self.width:
+                        self.screen.addstr(sy, sx + 2, city['name'], palette['city_name'])
+                    label_manager.register(sx, sy, name_len + 2)
+
+    def draw_labels(self, labels, label_manager):
+        # tile labels
+        if self.zoom <= 20: return
+        labels.sort(key=lambda x: x.get('rank', 99))
+        for f in labels:
+            name = f['name']
+            if f['type'] == 'road' and self.zoom > 1500:
+                pts = [self.to_screen(*pt) for pt in f['coords']]
+                if len(pts) > 1:
+                    sx, sy = pts[len(pts) // 2]
+                    if 0 <= sy < self.height and 0 <= sx < self.width - len(name):
+                        if label_manager.can_draw(sx, sy, len(name)):
+                            self.screen.addstr(sy, sx, name, self.palette['road_label'])
+                            label_manager.register(sx, sy, len(name))
+
+            elif f['type'] == 'label':
+                sx, sy = self.to_screen(*f['coords'])
+                if 0 <= sy < self.height and 0 <= sx < self.width:
+                    if label_manager.can_draw(sx, sy, len(name)):
+                        self.screen.addstr(sy, sx, name, self.palette['place_label'])
+                        label_manager.register(sx, sy, len(name))
+
+    def load_tiles(self, cam_x, cam_y, zoom):
+        # headless has no fetcher, load whatever the view needs up front
+        # (from the tile store, or downloaded if its not there)
+        from map_data import process_single_tile
+        self.cam_x, self.cam_y, self.zoom = cam_x, cam_y, zoom
+        if zoom <= 20.0: return
+        tile_manager = self.data.tile_manager
+        tile_z = self.tile_policy.update(zoom, self.aspect_ratio)
+        for key in tiles_for_view(*self.view(), tile_z):
+            if tile_manager.has_tile(*key) and not tile_manager.retry_due(*key): continue
+            try: tile, failed = process_single_tile(*key), False
+            except Exception: tile, failed = PackedTile.empty(), True
+            tile_manager.add_tile(*key, tile, failed)
+
+def to_text(screen):
+    return "\n".join(screen.chars.view(f"U{screen.width}")[:, 0].tolist()) + "\n"
+
+def to_ansi(screen):
+    # headless attrs -> sgr escapes, one per run of equal attrs
+    lines = screen.chars.view(f"U{screen.width}")[:, 0].tolist()
+    out = []
+    for y, start, length, attr in fast_find_runs(screen.attrs).tolist():
+        if start == 0 and y: out.append("\x1b[0m\n")
+        sgr = pair_ansi.get(attr & 0xff, "0")
+        if attr & BOLD: sgr += ";1"
+        if attr & DIM: sgr += ";2"
+        out.append(f"\x1b[0;{sgr}m{lines[y][start:start + length]}")
+    out.append("\x1b[0m\n")
+    return "".join(out)
+
+## batch cli
+def parse_views(path):
+    # "lon lat zoom" per line, # comments
+    views = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].split()
+            if not line: continue
+            lon, lat, zoom = map(float, line[:3])
+            views.append((lon, lat, zoom))
+    return views
+
+def render_views(views, size, out_dir=None, fmt="ansi", tiles=True, first=0):
+    # renders views[i] into out_dir/{first + i}.{fmt}, returns
+    # (frames, seconds spent rendering), tile loading isnt counted
+    import map_data
+    width, height = size
+    data = map_data.mapData()
+    map_data.load_initial_data(data)
+    warm_up()
+    renderer = Renderer(data, width, height)
+    write = to_ansi if fmt == "ansi" else to_text
+    busy = 0.0
+    try:
+        for i, (lon, lat, zoom) in enumerate(views):
+            cam_x, cam_y = mercator_project(lat, lon)
+            if tiles: renderer.load_tiles(cam_x, cam_y, zoom)
+            t0 = time.perf_counter()
+            text = write(renderer.render(cam_x, cam_y, zoom))
+            busy += time.perf_counter() - t0
+            if out_dir:
+                with open(os.path.join(out_dir, f"{first + i:05d}.{fmt}"), "w") as f: f.write(text)
+    finally:
+        data.shutdown()
+    return len(views), busy
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="render map viewports to files without a terminal")
+    parser.add_argument("views", help='file with one "lon lat zoom" per line')
+    parser.add_argument("--size", default="160x48", help="columns x rows (default 160x48)")
+    parser.add_argument("--out", help="directory for the frames, leave out to only time them")
+    parser.add_argument("--format", choices=("ansi", "txt"), default="ansi")
+    parser.add_argument("--processes", type=int, default=1, help="render in this many processes")
+    parser.add_argument("--no-tiles", action="store_true", help="base layers only, dont load vector tiles")
+    args = parser.parse_args(argv)
+
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+    views = parse_views(args.views)
+    if args.out: os.makedirs(args.out, exist_ok=True)
+
+    t0 = time.perf_counter()
+    n = max(1, min(args.processes, len(views)))
+    if n == 1:
+        results = [render_views(views, size, args.out, args.format, not args.no_tiles)]
+    else:
+        # contiguous chunks so nearby views share loaded tiles
+        step = math.ceil(len(views) / n)
+        with ProcessPoolExecutor(n, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(render_views, [views[i:i + step] for i in range(0, len(views), step)],
+                                    [size] * n, [args.out] * n, [args.format] * n, [not args.no_tiles] * n,
+                                    range(0, len(views), step)))
+    wall = time.perf_counter() - t0
+
+    frames = sum(r[0] for r in results)
+    busy = sum(r[1] for r in results)
+    print(f"{frames} frames of {size[0]}x{size[1]} in {wall:.2f} s, "
+          f"{frames / busy if busy else 0:.1f} fps per core rendering, {frames / wall:.1f} fps overall ({n} processes)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
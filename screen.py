@@ -0,0 +1,77 @@
+import curses
+import numpy as np
+from braille import fast_find_runs
+
+# keeps the whole composed screen (glyphs + curses attrs) in arrays and
+# only sends cells that changed since the last flush to the terminal
+class ScreenBuffer:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.chars = np.full((height, width), 0x20, dtype=np.uint32)
+        self.attrs = np.zeros((height, width), dtype=np.int64)
+
+        # last frame that actually went out, None forces a full redraw
+        self.prev_chars = None
+        self.prev_attrs = None
+
+    def clear(self):
+        self.chars.fill(0x20)
+        self.attrs.fill(0)
+
+    def invalidate(self):
+        # something wrote to stdscr behind our back (prompts, menus)
+        self.prev_chars = None
+        self.prev_attrs = None
+
+    def snapshot(self):
+        return self.chars.copy(), self.attrs.copy()
+
+    def restore(self, snap):
+        chars, attrs = snap
+        self.chars[:] = chars
+        self.attrs[:] = attrs
+
+    def addstr(self, y, x, text, attr=0):
+        # same call shape as stdscr.addstr, but clips instead of raising
+        if y < 0 or y >= self.height or x >= self.width or not text: return
+        if x < 0:
+            text = text[-x:]
+            x = 0
+        text = text[:self.width - x]
+        if not text: return
+        self.chars[y, x:x + len(text)] = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        self.attrs[y, x:x + len(text)] = attr
+
+    def addch(self, y, x, ch, attr=0):
+        self.addstr(y, x, ch, attr)
+
+    def blit_braille(self, braille, attr_table):
+        # attr_table maps braille color index -> curses attr
+        rows = min(self.height, braille.rows)
+        cols = min(self.width, braille.cols)
+        glyphs = braille.glyphs()
+        colors = np.where(braille.buffer != 0, braille.colors, 0)
+        self.chars[:rows, :cols] = glyphs[:rows, :cols]
+        self.attrs[:rows, :cols] = attr_table[colors[:rows, :cols]]
+
+    def flush(self, stdscr):
+        if self.width == 0 or self.height == 0: return
+        if self.prev_chars is None:
+            stdscr.clear()
+            changed = np.ones(self.chars.shape, dtype=np.bool_)
+        else:
+            changed = (self.chars != self.prev_chars) | (self.attrs != self.prev_attrs)
+            if not changed.any(): return
+
+        # runs of changed cells sharing an attr, -1 marks untouched cells
+        runs = fast_find_runs(np.where(changed, self.attrs, -1))
+        runs = runs[runs[:, 3] >= 0]
+        lines = self.chars.view(f"U{self.width}")[:, 0].tolist()
+
+        for y, start, length, attr in runs.tolist():
+            try: stdscr.addstr(y, start, lines[y][start:start + length], attr)
+            except curses.error: pass # bottom right cell always complains
+
+        self.prev_chars = self.chars.copy()
+        self.prev_attrs = self.attrs.copy()
@@ -0,0 +1,170 @@
+import os
+import sys
+import time
+import math
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import routing
+import map_data
+from tiles import *
+
+# fills the tile store for a region ahead of time so the map works offline,
+# raw tiles first, then their processed form so nothing is decoded later
+#   python seed.py --bbox 2.2 48.8 2.45 48.92 --zooms 8,12,14
+#   python seed.py --place "lisbon" --radius 10
+# already stored tiles are skipped, so an interrupted run just picks up again
+
+# the tile zooms main.py actually draws
+default_zooms = "8,12,14"
+
+class RateLimiter:
+    # at most `rate` calls per second across all threads
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval: return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+        if slot > now: time.sleep(slot - now)
+
+def parse_zooms(text):
+    # "8,12,14" or "10-14" or a mix
+    zooms = set()
+    for part in text.split(","):
+        if "-" in part:
+            a, b = part.split("-")
+            zooms.update(range(int(a), int(b) + 1))
+        else:
+            zooms.add(int(part))
+    return sorted(zooms)
+
+def place_bbox(name, radius_km):
+    # geocode once, then a square of radius_km around it
+    point = routing.geocode_address(name)
+    if point is None: return None
+    lon, lat = point
+    d_lat = radius_km / 111.32
+    d_lon = d_lat / max(math.cos(math.radians(lat)), 0.01)
+    return lon - d_lon, lat - d_lat, lon + d_lon, lat + d_lat
+
+def region_tiles(bbox, zooms):
+    lon_min, lat_min, lon_max, lat_max = bbox
+    return [key for z in zooms for key in tiles_for_bbox(lon_min, lat_min, lon_max, lat_max, z)]
+
+def progress_line(done, total, failed, t0, width=30):
+    frac = done / total if total else 1.0
+    filled = int(width * frac)
+    rate = done / max(time.monotonic() - t0, 1e-9)
+    return f"\r[{'#' * filled}{'.' * (width - filled)}] {done}/{total} tiles  {rate:6.1f}/s  failed {failed} "
+
+def seed(keys, workers=tile_fetch_workers, rate=10.0, download=download_tile, out=sys.stderr):
+    # downloads whatever the store doesnt have yet, returns (fetched, failed)
+    store = tile_store()
+    todo = store.missing(keys)
+    out.write(f"{len(keys)} tiles in region, {len(keys) - len(todo)} already stored\n")
+
+    limiter = RateLimiter(rate)
+    lock = threading.Lock()
+    counts = {'done': 0, 'failed': 0}
+    t0 = time.monotonic()
+
+    def fetch(key):
+        limiter.wait()
+        ok = download(*key) is not None
+        with lock:
+            counts['done'] += 1
+            if not ok: counts['failed'] += 1
+
+    with ThreadPoolExecutor(workers) as pool:
+        watch([pool.submit(fetch, key) for key in todo], counts, t0, out)
+    store.flush()
+    return counts['done'] - counts['failed'], counts['failed']
+
+def build_one(key):
+    # runs in a worker process, the result goes straight into the store
+    try: return len(map_data.process_tile_bytes(*key)) > 0
+    except Exception: return False
+
+def prebuild(keys, processes=None, out=sys.stderr):
+    # process every stored tile that has no processed copy of the current
+    # version yet, spread over worker processes since its all cpu.
+    # returns (built, failed)
+    store = tile_store()
+    store.flush()
+    no_raw = set(store.missing(keys))
+    todo = [key for key in store.missing(keys, map_data.tile_processing_version) if key not in no_raw]
+    out.write(f"processing {len(todo)} tiles\n")
+    if not todo: return 0, 0
+
+    counts = {'done': 0, 'failed': 0}
+    t0 = time.monotonic()
+    def done(f):
+        if f.cancelled(): return
+        counts['done'] += 1
+        if f.exception() is not None or not f.result(): counts['failed'] += 1
+    with ProcessPoolExecutor(processes or os.cpu_count(), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [pool.submit(build_one, key) for key in todo]
+        for f in futures: f.add_done_callback(done)
+        watch(futures, counts, t0, out)
+    return counts['done'] - counts['failed'], counts['failed']
+
+def watch(futures, counts, t0, out):
+    # progress bar until the futures are done, ctrl-c cancels the rest.
+    # whatever made it into the store stays, rerun to resume
+    try:
+        while not all(f.done() for f in futures):
+            out.write(progress_line(counts['done'], len(futures), counts['failed'], t0))
+            out.flush()
+            time.sleep(0.25)
+    except KeyboardInterrupt:
+        for f in futures: f.cancel()
+        out.write("\ninterrupted\n")
+    out.write(progress_line(counts['done'], len(futures), counts['failed'], t0) + "\n")
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="download map tiles for offline use")
+    parser.add_argument("--bbox", type=float, nargs=4, metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"))
+    parser.add_argument("--place", help="place name, geocoded once")
+    parser.add_argument("--radius", type=float, default=5.0, help="km around --place (default 5)")
+    parser.add_argument("--zooms", default=default_zooms, help=f"tile zooms, eg 8,12,14 or 10-14 (default {default_zooms})")
+    parser.add_argument("--workers", type=int, default=tile_fetch_workers, help="concurrent downloads")
+    parser.add_argument("--rate", type=float, default=10.0, help="max tiles per second, 0 for no limit")
+    parser.add_argument("--processes", type=int, default=0, help="processes for prebuilding (default: all cores)")
+    parser.add_argument("--no-process", action="store_true", help="only download, skip prebuilding processed tiles")
+    parser.add_argument("--max-tiles", type=int, default=50000, help="refuse regions bigger than this")
+    args = parser.parse_args(argv)
+
+    if args.bbox:
+        bbox = tuple(args.bbox)
+    elif args.place:
+        bbox = place_bbox(args.place, args.radius)
+        if bbox is None:
+            print(f"couldnt find {args.place!r}")
+            return 1
+        print("bbox: " + ",".join(f"{v:.5f}" for v in bbox))
+    else:
+        parser.error("need --bbox or --place")
+
+    keys = region_tiles(bbox, parse_zooms(args.zooms))
+    if len(keys) > args.max_tiles:
+        print(f"{len(keys)} tiles is more than --max-tiles {args.max_tiles}, shrink the region or zooms")
+        return 1
+
+    fetched, failed = seed(keys, args.workers, args.rate)
+    msg = f"fetched {fetched}, failed {failed}"
+    if not args.no_process:
+        built, build_failed = prebuild(keys, args.processes)
+        msg += f", processed {built}, failed {build_failed}"
+        failed += build_failed
+    print(msg + (", rerun to retry" if failed else ""))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
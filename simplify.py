@@ -0,0 +1,71 @@
+import numpy as np
+from numba import jit
+
+@jit(nopython=True, cache=True)
+def seg_dist_sq(px, py, ax, ay, bx, by):
+    # squared distance from p to segment a-b (a == b for closed rings)
+    dx = bx - ax
+    dy = by - ay
+    l2 = dx * dx + dy * dy
+    if l2 == 0.0:
+        ex = px - ax
+        ey = py - ay
+        return ex * ex + ey * ey
+    t = ((px - ax) * dx + (py - ay) * dy) / l2
+    if t < 0.0: t = 0.0
+    elif t > 1.0: t = 1.0
+    ex = px - (ax + t * dx)
+    ey = py - (ay + t * dy)
+    return ex * ex + ey * ey
+
+@jit(nopython=True, cache=True)
+def fast_simplify_mask(coords, offsets, tolerance):
+    # douglas-peucker over every line of a packed array, returns a keep mask
+    n = len(coords)
+    keep = np.zeros(n, dtype=np.bool_)
+    stack = np.empty((max(n, 1), 2), dtype=np.int64)
+    tol_sq = tolerance * tolerance
+
+    for li in range(len(offsets) - 1):
+        s = offsets[li]
+        e = offsets[li + 1] - 1
+        if e < s: continue
+        keep[s] = True
+        keep[e] = True
+
+        top = 0
+        stack[0, 0] = s
+        stack[0, 1] = e
+        top = 1
+        while top > 0:
+            top -= 1
+            a = stack[top, 0]
+            b = stack[top, 1]
+            if b - a < 2: continue
+
+            best = -1.0
+            best_i = a
+            for i in range(a + 1, b):
+                d = seg_dist_sq(coords[i, 0], coords[i, 1], coords[a, 0], coords[a, 1], coords[b, 0], coords[b, 1])
+                if d > best:
+                    best = d
+                    best_i = i
+
+            if best > tol_sq:
+                keep[best_i] = True
+                stack[top, 0] = a
+                stack[top, 1] = best_i
+                stack[top + 1, 0] = best_i
+                stack[top + 1, 1] = b
+                top += 2
+    return keep
+
+def simplify_lines(coords, offsets, tolerance):
+    # packed (coords, offsets) in, simplified packed (coords, offsets) out,
+    # line count and order are unchanged
+    if len(coords) == 0 or tolerance <= 0:
+        return coords, offsets
+    keep = fast_simplify_mask(coords, offsets, float(tolerance))
+    kept = np.zeros(len(coords) + 1, dtype=np.int64)
+    np.cumsum(keep, out=kept[1:])
+    return coords[keep], kept[offsets].astype(np.int32)
@@ -0,0 +1,69 @@
+import math
+import numpy as np
+
+# uniform grid over (min_x, min_y, max_x, max_y) boxes, items are stored
+# in every cell they touch as one sorted id array + per-cell start offsets
+class GridIndex:
+    def __init__(self, bboxes, cell_size=None):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        n = len(self.bboxes)
+
+        if n == 0:
+            self.nx = self.ny = 0
+            return
+
+        self.min_x = self.bboxes[:, 0].min()
+        self.min_y = self.bboxes[:, 1].min()
+        span_x = self.bboxes[:, 2].max() - self.min_x
+        span_y = self.bboxes[:, 3].max() - self.min_y
+
+        # roughly one item per cell
+        if cell_size is None:
+            cell_size = max(span_x, span_y) / max(1, int(math.sqrt(n)))
+        self.cell = max(cell_size, 1e-12)
+
+        while True:
+            self.nx = int(span_x / self.cell) + 1
+            self.ny = int(span_y / self.cell) + 1
+            x0, y0, x1, y1 = self.cell_range(self.bboxes[:, 0], self.bboxes[:, 1],
+                                             self.bboxes[:, 2], self.bboxes[:, 3])
+            w = x1 - x0 + 1
+            counts = w * (y1 - y0 + 1)
+            # big boxes land in many cells, coarsen until that stays bounded
+            if counts.sum() <= 4 * n + 64 or self.nx * self.ny == 1: break
+            self.cell *= 2
+
+        # expand each item into the cells of its box
+        ids = np.repeat(np.arange(n), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        w = np.repeat(w, counts)
+        cells = (np.repeat(y0, counts) + local // w) * self.nx + np.repeat(x0, counts) + local % w
+
+        order = np.argsort(cells, kind="stable")
+        self.items = ids[order].astype(np.int32)
+        self.starts = np.searchsorted(cells[order], np.arange(self.nx * self.ny + 1)).astype(np.int32)
+
+    def __len__(self):
+        return len(self.bboxes)
+
+    def cell_range(self, min_x, min_y, max_x, max_y):
+        x0 = np.clip(np.floor((min_x - self.min_x) / self.cell), 0, self.nx - 1).astype(np.int64)
+        y0 = np.clip(np.floor((min_y - self.min_y) / self.cell), 0, self.ny - 1).astype(np.int64)
+        x1 = np.clip(np.floor((max_x - self.min_x) / self.cell), 0, self.nx - 1).astype(np.int64)
+        y1 = np.clip(np.floor((max_y - self.min_y) / self.cell), 0, self.ny - 1).astype(np.int64)
+        return x0, y0, x1, y1
+
+    def query(self, min_x, min_y, max_x, max_y):
+        # ids of items whose bbox intersects the query box, ascending
+        if self.nx == 0:
+            return np.empty(0, dtype=np.int64)
+
+        x0, y0, x1, y1 = (int(v) for v in self.cell_range(min_x, min_y, max_x, max_y))
+        # cells of one grid row are contiguous in the sorted id array
+        parts = [self.items[self.starts[gy * self.nx + x0]:self.starts[gy * self.nx + x1 + 1]]
+                 for gy in range(y0, y1 + 1)]
+        cand = np.unique(np.concatenate(parts)).astype(np.int64)
+
+        b = self.bboxes[cand]
+        hit = (b[:, 2] >= min_x) & (b[:, 0] <= max_x) & (b[:, 3] >= min_y) & (b[:, 1] <= max_y)
+        return cand[hit]
@@ -0,0 +1,116 @@
+import time
+import threading
+import pytest
+import tiles
+import map_data
+from map_data import TileManager, TileFetcher
+from geometry import PackedTile
+from bench import local_server, tile_pattern
+
+# the fetch scheduler against a local stand-in tile server,
+# `python -m pytest test_fetch.py`
+
+@pytest.fixture
+def tile_url(tmp_path, monkeypatch):
+    # tiles.tile_url is read from the env at import, set both
+    with local_server({None: (b"\0" * 512, 0.0)}, tile_pattern) as url:
+        monkeypatch.setenv("CARTOASCII_TILE_URL", url)
+        monkeypatch.setattr(tiles, "tile_url", url)
+        monkeypatch.setattr(tiles, "cache", str(tmp_path / "tiles.mbtiles"))
+        monkeypatch.setattr(tiles, "store", None)
+        yield url
+        if tiles.store is not None: tiles.store.close()
+
+class Gated:
+    # downloads for one worker that waits at the gate before each tile, so
+    # the test decides what is queued while a tile is in flight
+    def __init__(self):
+        self.order = []
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def __call__(self, z, x, y):
+        self.started.set()
+        assert self.gate.wait(5)
+        if tiles.download_tile(z, x, y) is None: raise IOError("download failed")
+        self.order.append((z, x, y))
+        return PackedTile.empty()
+
+def wait_idle(fetcher):
+    deadline = time.monotonic() + 5
+    while fetcher.pending():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+def start(process):
+    manager = TileManager()
+    return manager, TileFetcher(manager, workers=1, process=process)
+
+def test_downloads_in_priority_order(tile_url):
+    process = Gated()
+    manager, fetcher = start(process)
+    fetcher.want([((12, 0, 0), 0)])
+    assert process.started.wait(5)
+
+    # queued while the worker is busy, comes out lowest priority first
+    keys = [(12, x, 1) for x in range(8)]
+    priorities = [5, 3, 7, 0, 6, 1, 4, 2]
+    fetcher.want(list(zip(keys, priorities)))
+    process.gate.set()
+    wait_idle(fetcher)
+    fetcher.shutdown()
+    assert process.order == [(12, 0, 0)] + [k for _, k in sorted(zip(priorities, keys))]
+    assert all(manager.has_tile(*key) for key in keys)
+
+def test_want_cancels_what_scrolled_away(tile_url):
+    process = Gated()
+    manager, fetcher = start(process)
+    fetcher.want([((12, 0, 0), 0)])
+    assert process.started.wait(5)
+
+    old = [((12, x, 1), x) for x in range(8)]
+    fetcher.want(old)
+    moved = [((13, 0, y), y) for y in range(4)]
+    fetcher.want(moved)
+    process.gate.set()
+    wait_idle(fetcher)
+    fetcher.shutdown()
+    assert process.order == [(12, 0, 0)] + [k for k, _ in moved]
+    assert fetcher.stats()['cancelled'] == len(old)
+    assert not any(manager.has_tile(*key) for key, _ in old)
+
+def test_in_flight_and_loaded_tiles_arent_queued_again(tile_url):
+    process = Gated()
+    manager, fetcher = start(process)
+    fetcher.want([((12, 0, 0), 0)])
+    assert process.started.wait(5)
+    fetcher.want([((12, 0, 0), 0)])
+    assert fetcher.stats()['queued'] == 0
+    process.gate.set()
+    wait_idle(fetcher)
+    fetcher.want([((12, 0, 0), 0)])
+    assert fetcher.pending() == 0
+    fetcher.shutdown()
+    assert process.order == [(12, 0, 0)]
+
+def test_failed_tiles_are_retried_after_a_while(tile_url, monkeypatch):
+    calls = []
+    def process(z, x, y):
+        calls.append((z, x, y))
+        if len(calls) == 1: raise IOError("download failed")
+        return PackedTile.empty()
+    manager, fetcher = start(process)
+    key = (12, 0, 0)
+    fetcher.want([(key, 0)])
+    wait_idle(fetcher)
+    assert manager.has_tile(*key) and key in manager.failed
+
+    # not yet due, nothing is queued
+    fetcher.want([(key, 0)])
+    assert fetcher.pending() == 0 and len(calls) == 1
+
+    monkeypatch.setattr(map_data, "tile_retry_after", 0.0)
+    fetcher.want([(key, 0)])
+    wait_idle(fetcher)
+    fetcher.shutdown()
+    assert len(calls) == 2 and key not in manager.failed
@@ -0,0 +1,63 @@
+import numpy as np
+from geometry import *
+
+# PackedTile.to_bytes/from_bytes is what the process pool and the processed
+# tile store pass around, `python -m pytest test_geometry.py`
+
+def sample_tile():
+    builder = TileBuilder()
+    builder.add(ROAD, [(0.0, 0.0), (1.0, 1.0), (2.0, 0.5)], cls='primary', color=3, z_index=4, rank=99, name='Rue de Rivoli')
+    builder.add(BUILDING, [(0.1, 0.1), (0.2, 0.1), (0.2, 0.2)], color=2, z_index=2)
+    builder.add(LABEL, [(1.5, 1.5)], cls='city', z_index=9, rank=1, name='Zürich 東京')
+    # names are arbitrary strings, including the old separator
+    builder.add(LABEL, [(0.5, 0.5)], name='a\0b')
+    builder.add(ROAD, [(3.0, 3.0), (4.0, 4.0)], cls='primary', name='Rue de Rivoli')
+    return builder.build()
+
+def assert_same(a, b):
+    for col in ('coords', 'offsets', 'bbox', 'kind', 'cls', 'color', 'z_index', 'rank', 'name'):
+        x, y = getattr(a, col), getattr(b, col)
+        assert x.dtype == y.dtype and np.array_equal(x, y), col
+    assert a.names == b.names
+
+def test_round_trip():
+    tile = sample_tile()
+    back = PackedTile.from_bytes(tile.to_bytes())
+    assert_same(tile, back)
+    assert back.names == ['primary', 'Rue de Rivoli', 'city', 'Zürich 東京', 'a\0b']
+    assert [back.label(i)['name'] for i in range(len(back))] == ['Rue de Rivoli', '', 'Zürich 東京', 'a\0b', 'Rue de Rivoli']
+    assert back.to_bytes() == tile.to_bytes()
+
+def test_empty_tile():
+    tile = PackedTile.empty()
+    back = PackedTile.from_bytes(tile.to_bytes())
+    assert len(back) == 0 and back.names == []
+    assert_same(tile, back)
+    assert len(back.query(-1e9, -1e9, 1e9, 1e9)) == 0
+
+def test_tile_without_names():
+    builder = TileBuilder()
+    builder.add(ROAD, [(0.0, 0.0), (1.0, 1.0)])
+    back = PackedTile.from_bytes(builder.build().to_bytes())
+    assert back.names == [] and back.label(0)['name'] == ''
+
+def test_read_only_views():
+    tile = sample_tile()
+    data = tile.to_bytes()
+    back = PackedTile.from_bytes(data)
+    for col in ('coords', 'offsets', 'bbox', 'kind', 'name'):
+        arr = getattr(back, col)
+        assert not arr.flags.writeable
+        assert np.shares_memory(arr, np.frombuffer(data, dtype=np.uint8))
+    # everything the renderer does with a tile works on the views
+    assert np.array_equal(np.sort(back.query(0.0, 0.0, 2.0, 2.0)), np.sort(tile.query(0.0, 0.0, 2.0, 2.0)))
+    lod = back.lod(0.5)
+    assert len(lod) == len(back) and len(lod.coords) <= len(back.coords)
+    assert_same(PackedTile.from_bytes(back.to_bytes()), tile)
+
+def test_lod_layer_nbytes_counts_each_level_once():
+    rng = np.random.default_rng(0)
+    layer = LodLayer.from_lines([np.cumsum(rng.uniform(-1, 1, (50, 2)), axis=0) for _ in range(100)])
+    full = layer.levels[0]
+    simplified = sum(l.coords.nbytes + l.offsets.nbytes for l in layer.levels[1:])
+    assert layer.nbytes == full.nbytes + simplified
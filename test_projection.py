@@ -0,0 +1,67 @@
+import numpy as np
+from drawing_utils import mercator_project, mercator_unproject
+from tiles import tile_coords_to_lonlat
+from projection import *
+
+# the batch projection in projection.py has to land on the same numbers as
+# the scalar functions it replaced, `python -m pytest test_projection.py`
+
+rng = np.random.default_rng(0)
+
+def test_lonlat_to_mercator_matches_scalar():
+    # past +-85.05 on purpose, both sides clamp there
+    lon = rng.uniform(-180, 180, 500)
+    lat = np.concatenate([rng.uniform(-89.9, 89.9, 496), [90.0, -90.0, mercator_const, -mercator_const]])
+    mx, my = lonlat_to_mercator(lon, lat)
+    expected = np.array([mercator_project(la, lo) for lo, la in zip(lon, lat)])
+    assert np.allclose(mx, expected[:, 0], rtol=0, atol=1e-9)
+    assert np.allclose(my, expected[:, 1], rtol=0, atol=1e-9)
+
+def test_clamp():
+    _, my = lonlat_to_mercator([0.0, 0.0, 0.0, 0.0], [90.0, -90.0, 86.0, -86.0])
+    assert np.allclose(my, [max_my, -max_my, max_my, -max_my], rtol=0, atol=1e-9)
+    assert abs(mercator_project(90.0, 0.0)[1] - max_my) < 1e-9
+    assert abs(max_my - 180.0) < 1e-3
+
+def test_mercator_to_lonlat_matches_scalar():
+    mx = rng.uniform(-180, 180, 500)
+    my = rng.uniform(-max_my, max_my, 500)
+    lon, lat = mercator_to_lonlat(mx, my)
+    assert np.array_equal(lon, mx)
+    assert np.allclose(lat, [mercator_unproject(v) for v in my], rtol=0, atol=1e-9)
+
+def test_round_trip():
+    lon = rng.uniform(-180, 180, 500)
+    lat = rng.uniform(-mercator_const, mercator_const, 500)
+    back_lon, back_lat = mercator_to_lonlat(*lonlat_to_mercator(lon, lat))
+    assert np.allclose(back_lon, lon, rtol=0, atol=1e-9)
+    assert np.allclose(back_lat, lat, rtol=0, atol=1e-9)
+
+def test_tile_to_mercator_matches_scalar():
+    for z in (0, 1, 8, 12, 14):
+        n = 2 ** z
+        # include the outer rows, where the latitude clamp kicks in
+        for x, y in [(0, 0), (n - 1, n - 1)] + [tuple(k) for k in rng.integers(0, n, (5, 2))]:
+            px, py = rng.uniform(0, 4096, 50), rng.uniform(0, 4096, 50)
+            px[:2], py[:2] = (0, 4096), (0, 4096)
+            mx, my = tile_to_mercator(z, x, y, px, py)
+            for i in range(len(px)):
+                lon, lat = tile_coords_to_lonlat(z, x, y, px[i], py[i])
+                ex, ey = mercator_project(lat, lon)
+                assert abs(mx[i] - ex) < 1e-7
+                assert abs(my[i] - ey) < 1e-6
+
+def test_mercator_to_tile_inverts_tile_to_mercator():
+    for z, x, y in ((0, 0, 0), (8, 129, 90), (14, 8192, 5460)):
+        px, py = rng.uniform(0, 4096, 200), rng.uniform(0, 4096, 200)
+        back_x, back_y = mercator_to_tile(z, x, y, *tile_to_mercator(z, x, y, px, py))
+        assert np.allclose(back_x, px, rtol=0, atol=1e-6)
+        assert np.allclose(back_y, py, rtol=0, atol=1e-6)
+
+def test_coords_helpers():
+    lonlat = np.c_[rng.uniform(-180, 180, 100), rng.uniform(-89, 89, 100)]
+    out = lonlat_coords_to_mercator(lonlat)
+    assert out.shape == (100, 2)
+    assert np.allclose(out, [mercator_project(la, lo) for lo, la in lonlat], rtol=0, atol=1e-9)
+    tile = tile_coords_to_mercator(12, 2048, 1360, [(0, 0), (4096, 4096)])
+    assert np.allclose(tile, np.c_[tile_to_mercator(12, 2048, 1360, np.array([0, 4096]), np.array([0, 4096]))])
@@ -0,0 +1,106 @@
+import os
+import gzip
+import time
+import pytest
+from tile_store import TileStore, migrate, tms_row
+
+# the mbtiles tile store, `python -m pytest test_tile_store.py`
+
+@pytest.fixture
+def store(tmp_path):
+    store = TileStore(str(tmp_path / "tiles.mbtiles"))
+    yield store
+    store.close()
+
+def rows(store, table="tiles"):
+    store.flush()
+    return store.db.execute(f"SELECT zoom_level, tile_column, tile_row FROM {table}").fetchall()
+
+def test_round_trip_flips_rows(store):
+    store.put(3, 1, 2, b"pbf")
+    store.put_many([((14, 8192, 5460), b"more pbf"), ((0, 0, 0), b"")])
+    assert sorted(rows(store)) == [(0, 0, 0), (3, 1, 5), (14, 8192, 16383 - 5460)]
+    assert tms_row(3, 2) == 5 and tms_row(0, 0) == 0
+    assert store.get(3, 1, 2) == b"pbf"
+    assert store.get(3, 1, 5) is None
+    assert store.get_many([(14, 8192, 5460), (0, 0, 0), (1, 1, 1)]) == {(14, 8192, 5460): b"more pbf", (0, 0, 0): b""}
+    # stored gzipped like other mbtiles writers, already gzipped data is kept as is
+    blob, = store.db.execute("SELECT tile_data FROM tiles WHERE zoom_level = 3").fetchone()
+    assert gzip.decompress(blob) == b"pbf"
+    store.put(3, 1, 2, gzip.compress(b"zipped"))
+    assert store.get(3, 1, 2) == b"zipped"
+
+def test_pending_writes_are_visible_before_a_flush(store):
+    store.put(12, 1, 1, b"raw")
+    store.put_processed(12, 1, 1, 7, b"processed")
+    assert store.stats()['pending'] == 2
+    assert store.db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0] == 0
+    assert store.get(12, 1, 1) == b"raw"
+    assert store.get_processed(12, 1, 1, 7) == b"processed"
+    assert store.get_processed(12, 1, 1, 6) is None
+    assert store.missing([(12, 1, 1), (12, 1, 2)]) == [(12, 1, 2)]
+    assert store.missing([(12, 1, 1), (12, 1, 2)], version=7) == [(12, 1, 2)]
+    assert store.missing([(12, 1, 1)], version=8) == [(12, 1, 1)]
+
+    store.flush()
+    assert store.stats()['pending'] == 0
+    assert store.get(12, 1, 1) == b"raw" and store.get_processed(12, 1, 1, 7) == b"processed"
+    assert store.missing([(12, 1, 1), (12, 1, 2)], version=7) == [(12, 1, 2)]
+
+def test_replacing_a_tile_frees_the_old_copy(store):
+    store.put(12, 1, 1, b"a" * 5000)
+    store.put_processed(12, 1, 1, 1, b"b" * 300)
+    store.flush()
+    store.put(12, 1, 1, os.urandom(2000))
+    store.put_processed(12, 1, 1, 1, b"c" * 100)
+    store.flush()
+    assert store.bytes_used == store.count_bytes()
+    assert len(store) == 1
+
+def test_eviction_keeps_recently_used_rows(store):
+    keys = [(14, x, 0) for x in range(40)]
+    for key in keys:
+        store.put(*key, os.urandom(1000))
+        store.put_processed(*key, 1, os.urandom(1000))
+    store.flush()
+    time.sleep(0.01)
+    recent = keys[-5:]
+    store.get_many(recent)
+    for key in recent: store.get_processed(*key, 1)
+    store.flush()
+
+    store.max_bytes = store.bytes_used // 2
+    store.evict()
+    assert store.bytes_used == store.count_bytes()
+    # down to 90% of the budget so the next flush doesnt evict again
+    assert store.bytes_used <= store.max_bytes * 0.9
+    assert store.bytes_used > store.max_bytes * 0.8
+    assert all(store.get(*key) is not None and store.get_processed(*key, 1) is not None for key in recent)
+    assert store.missing(keys[:5]) == keys[:5]
+    assert store.stats()['evictions'] > 0
+
+def test_flush_evicts_past_the_budget(store):
+    store.max_bytes = 20000
+    for x in range(40): store.put(14, x, 0, os.urandom(1000))
+    store.flush()
+    assert store.bytes_used <= store.max_bytes
+
+def test_migrate(tmp_path, store):
+    cache_dir = tmp_path / "tile_cache"
+    cache_dir.mkdir()
+    for x in range(3):
+        (cache_dir / f"tile_14_{x}_7.pbf").write_bytes(b"tile %d" % x)
+    # failed downloads left empty files, those and anything else stay behind
+    (cache_dir / "tile_14_9_7.pbf").write_bytes(b"")
+    (cache_dir / "notes.txt").write_bytes(b"hi")
+
+    assert migrate(str(cache_dir), store, delete=True, batch=2) == 3
+    assert store.get_many([(14, x, 7) for x in range(3)]) == {(14, x, 7): b"tile %d" % x for x in range(3)}
+    assert store.missing([(14, 9, 7)]) == [(14, 9, 7)]
+    assert sorted(os.listdir(cache_dir)) == ["notes.txt", "tile_14_9_7.pbf"]
+
+    # without delete the files are left where they were
+    (cache_dir / "tile_15_1_1.pbf").write_bytes(b"again")
+    assert migrate(str(cache_dir), store) == 1
+    assert store.get(15, 1, 1) == b"again"
+    assert "tile_15_1_1.pbf" in os.listdir(cache_dir)
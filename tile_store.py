@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import gzip
+import time
+import multiprocessing.util
+import sqlite3
+import threading
+
+# single file tile cache, laid out as mbtiles (tms rows, gzipped pbf) so
+# other tools can open it. the extra size/last_used columns on the tiles
+# table drive eviction and are ignored by mbtiles readers. processed tiles
+# (PackedTile.to_bytes) sit next to them in their own table, keyed by the
+# processing version that made them
+
+schema = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB,
+    size INTEGER, last_used REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+CREATE INDEX IF NOT EXISTS tile_lru ON tiles (last_used);
+CREATE TABLE IF NOT EXISTS processed (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, version INTEGER, tile_data BLOB,
+    size INTEGER, last_used REAL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS processed_index ON processed (zoom_level, tile_column, tile_row, version);
+CREATE INDEX IF NOT EXISTS processed_lru ON processed (last_used);
+"""
+
+# pending writes go out in one transaction once there are this many
+# or the oldest has waited this long
+write_batch = 64
+write_delay = 2.0
+
+# let sqlite map the file instead of copying pages through read()
+mmap_bytes = 1 << 30
+
+def tms_row(z, y):
+    # mbtiles counts rows from the bottom
+    return (1 << z) - 1 - y
+
+class TileStore:
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA mmap_size={mmap_bytes}")
+        self.db.executescript(schema)
+        self.db.executemany("INSERT OR IGNORE INTO metadata VALUES (?, ?)",
+                            [("name", "cartoascii"), ("format", "pbf"), ("type", "baselayer")])
+
+        # writes and reads not sent to the db yet, per table:
+        # {table: {key: data}} and {table: {key: time}}, processed keys
+        # carry the version as a 4th element
+        self.pending = {'tiles': {}, 'processed': {}}
+        self.touched = {'tiles': {}, 'processed': {}}
+        self.pending_since = None
+        self.bytes_used = self.count_bytes()
+
+        # counters
+        self.evictions = 0
+
+        # multiprocessing's exit hook also runs in pool workers, atexit doesnt
+        multiprocessing.util.Finalize(None, self.close, exitpriority=10)
+
+    def __len__(self):
+        with self.lock:
+            self.flush()
+            return self.db.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def count_bytes(self):
+        return sum(self.db.execute(f"SELECT COALESCE(SUM(size), 0) FROM {table}").fetchone()[0]
+                   for table in ('tiles', 'processed'))
+
+    def select_block(self, table, columns, keys, version=None):
+        # rows for keys, wanted tiles are usually a block so this reads the
+        # covering rectangle per zoom level with one indexed range query
+        by_zoom = {}
+        for key in keys: by_zoom.setdefault(key[0], set()).add(key[:3])
+        extra = "" if version is None else f" AND version = {int(version)}"
+        for z, wanted in by_zoom.items():
+            xs = [x for _, x, _ in wanted]
+            rows = [tms_row(z, y) for _, _, y in wanted]
+            for x, row, *rest in self.db.execute(
+                    f"SELECT tile_column, tile_row{columns} FROM {table} WHERE zoom_level = ? "
+                    f"AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?{extra}",
+                    (z, min(xs), max(xs), min(rows), max(rows))):
+                key = (z, x, tms_row(z, row))
+                if key in wanted: yield key, rest
+
+    def get(self, z, x, y):
+        return self.get_many([(z, x, y)]).get((z, x, y))
+
+    def get_many(self, keys):
+        # {key: raw pbf} for the keys we have
+        out = {}
+        with self.lock:
+            pending = self.pending['tiles']
+            for key in keys:
+                if key in pending: out[key] = pending[key]
+            for key, (data,) in self.select_block('tiles', ", tile_data", [k for k in keys if k not in out]):
+                out[key] = data
+            self.touch('tiles', out)
+        return {key: unzip(data) for key, data in out.items()}
+
+    def get_processed(self, z, x, y, version):
+        # PackedTile bytes made by processing `version`, or None
+        key = (z, x, y, version)
+        with self.lock:
+            data = self.pending['processed'].get(key)
+            if data is None:
+                row = self.db.execute("SELECT tile_data FROM processed WHERE zoom_level = ? AND tile_column = ? "
+                                      "AND tile_row = ? AND version = ?", (z, x, tms_row(z, y), version)).fetchone()
+                data = row and row[0]
+            if data is not None: self.touch('processed', [key])
+            return data
+
+    def missing(self, keys, version=None):
+        # keys we dont have yet without reading any tile data, raw tiles
+        # by default or processed ones of `version`
+        table = 'tiles' if version is None else 'processed'
+        with self.lock:
+            present = {key[:3] for key in self.pending[table] if version is None or key[3] == version}
+            present.update(key for key, _ in self.select_block(table, "", keys, version))
+        return [key for key in keys if key not in present]
+
+    def touch(self, table, keys):
+        now = time.time()
+        for key in keys: self.touched[table][key] = now
+
+    def put(self, z, x, y, data):
+        self.put_many([((z, x, y), data)])
+
+    def put_many(self, items):
+        self.queue('tiles', [(key, gzip.compress(data, 6) if data[:2] != b"\x1f\x8b" else data)
+                             for key, data in items])
+
+    def put_processed(self, z, x, y, version, data):
+        self.queue('processed', [((z, x, y, version), data)])
+
+    def queue(self, table, items):
+        with self.lock:
+            self.pending[table].update(items)
+            if self.pending_since is None: self.pending_since = time.time()
+            if sum(map(len, self.pending.values())) >= write_batch or time.time() - self.pending_since > write_delay:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.db is None: return
+            if not any(self.pending.values()) and not any(self.touched.values()): return
+            added = 0
+            with self.db:
+                self.db.execute("BEGIN")
+                for table, pending in self.pending.items():
+                    touched = self.touched[table]
+                    rows = [(key[0], key[1], tms_row(key[0], key[2])) + key[3:] + (data, len(data), touched.get(key, time.time()))
+                            for key, data in pending.items()]
+                    where = "zoom_level = ? AND tile_column = ? AND tile_row = ?" + (" AND version = ?" if table == 'processed' else "")
+                    # replacing a tile frees the old copy
+                    for row in rows:
+                        prev = self.db.execute(f"SELECT size FROM {table} WHERE {where}", row[:-3]).fetchone()
+                        if prev: added -= prev[0]
+                    added += sum(row[-2] for row in rows)
+                    if rows:
+                        self.db.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+                    touches = [(t, key[0], key[1], tms_row(key[0], key[2])) + key[3:] for key, t in touched.items() if key not in pending]
+                    self.db.executemany(f"UPDATE {table} SET last_used = ? WHERE {where}", touches)
+                    pending.clear()
+                    touched.clear()
+            self.bytes_used += added
+            self.pending_since = None
+            if self.max_bytes and self.bytes_used > self.max_bytes: self.evict()
+
+    def evict(self):
+        # other processes write to the same file, so recount before deleting
+        with self.lock:
+            self.bytes_used = self.count_bytes()
+            if self.bytes_used <= self.max_bytes: return
+
+            # least recently used first across both tables, down to 90% so
+            # we dont evict every flush
+            target = self.bytes_used - int(self.max_bytes * 0.9)
+            doomed = {'tiles': [], 'processed': []}
+            freed = 0
+            for table, rowid, size, _ in self.db.execute(
+                    "SELECT 'tiles', rowid, size, last_used FROM tiles UNION ALL "
+                    "SELECT 'processed', rowid, size, last_used FROM processed ORDER BY last_used"):
+                if freed >= target: break
+                doomed[table].append((rowid,))
+                freed += size
+            with self.db:
+                self.db.execute("BEGIN")
+                for table, rowids in doomed.items():
+                    self.db.executemany(f"DELETE FROM {table} WHERE rowid = ?", rowids)
+            self.bytes_used -= freed
+            self.evictions += sum(map(len, doomed.values()))
+
+    def stats(self):
+        with self.lock:
+            return {
+                'bytes': self.bytes_used,
+                'budget': self.max_bytes,
+                'pending': sum(map(len, self.pending.values())),
+                'evictions': self.evictions,
+            }
+
+    def close(self):
+        with self.lock:
+            if self.db is None: return
+            self.flush()
+            self.db.close()
+            self.db = None
+
+def unzip(data):
+    return gzip.decompress(data) if data[:2] == b"\x1f\x8b" else data
+
+## migration from the old tile_cache/tile_{z}_{x}_{y}.pbf layout
+tile_file = re.compile(r"tile_(\d+)_(\d+)_(\d+)\.pbf$")
+
+def migrate(cache_dir, store, delete=False, batch=500):
+    moved = 0
+    items, paths = [], []
+    def write():
+        store.put_many(items)
+        store.flush()
+        if delete:
+            for p in paths: os.remove(p)
+        items.clear()
+        paths.clear()
+
+    for entry in os.scandir(cache_dir):
+        m = tile_file.match(entry.name)
+        if not m: continue
+        with open(entry.path, "rb") as f: data = f.read()
+        if not data: continue
+        items.append(((int(m[1]), int(m[2]), int(m[3])), data))
+        paths.append(entry.path)
+        moved += 1
+        if len(items) >= batch: write()
+    write()
+    return moved
+
+if __name__ == "__main__":
+    # python tile_store.py migrate [tile_cache] [tiles.mbtiles] [--delete]
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if not args or args[0] != "migrate":
+        print("usage: python tile_store.py migrate [cache_dir] [store.mbtiles] [--delete]")
+        sys.exit(1)
+    here = os.path.dirname(os.path.abspath(__file__))
+    cache_dir = args[1] if len(args) > 1 else os.path.join(here, "tile_cache")
+    path = args[2] if len(args) > 2 else os.path.join(here, "tiles.mbtiles")
+    store = TileStore(path)
+    t0 = time.time()
+    n = migrate(cache_dir, store, delete="--delete" in sys.argv)
+    store.close()
+    print(f"moved {n} tiles into {path} in {time.time() - t0:.1f}s")
@@ -1,15 +1,33 @@
 import os
 import math
+import threading
 import requests
-from functools import lru_cache
-import mapbox_vector_tile
+from requests.adapters import HTTPAdapter
+from collections import OrderedDict
+from tile_store import TileStore
+from zoom_policy import tile_zoom_for
 
 # i dont care enough to hide my key
 tile_url = "https://api.maptiler.com/tiles/v3/{z}/{x}/{y}.pbf?key=1ZYMvxU2tPyKhJIOyZDu"
+# point this at a local server (python -m http.server etc) for testing
+tile_url = os.environ.get("CARTOASCII_TILE_URL", tile_url)
 
-# create cache
-cache = os.path.join(os.path.dirname(__file__), "tile_cache")
-os.makedirs(cache, exist_ok=True)
+# how many tiles download at once, also sizes the connection pool
+tile_fetch_workers = int(os.environ.get("CARTOASCII_FETCH_WORKERS", 4))
+
+# downloaded tiles live in one mbtiles file, capped at this many bytes.
+# `python tile_store.py migrate` moves an old tile_cache/ directory in.
+# CARTOASCII_TILE_CACHE is the path of that file, no longer a directory
+cache = os.environ.get("CARTOASCII_TILE_CACHE", os.path.join(os.path.dirname(__file__), "tiles.mbtiles"))
+cache_max_bytes = int(os.environ.get("CARTOASCII_TILE_CACHE_MB", 1024)) * 1024 * 1024
+
+# in memory we only keep raw pbf, and only until the tile is processed.
+# decoded tiles arent cached at all, they live just long enough to become
+# a PackedTile (which TileManager and the store keep)
+raw_cache_budget = 16 * 1024 * 1024
+
+# the layers map_data.build_tile reads, the rest is never decoded
+used_layers = ('transportation', 'building', 'place', 'poi')
 
 def lonlat_to_tile_xy(lon, lat, z):
     # long/lat to WebMercator tile coords
@@ -42,52 +60,143 @@ def tile_coords_to_lonlat(z, x, y, px, py, extent=4096):
     return lon_deg, lat_deg
 
 ## fecthing + caching
-def tile_cache_path(z, x, y):
-    return os.path.join(cache, f"tile_{z}_{x}_{y}.pbf")
-
-
-@lru_cache(maxsize=4096)
-def fetch_tile_raw(z, x, y):
-    # download direclty or fecth from cache
-    cache_path = tile_cache_path(z, x, y)
-
-    # read cache if exists
-    if os.path.exists(cache_path):
-        try:
-            with open(cache_path, "rb") as f:
-                return f.read()
-        except:
-            pass
-
-    # download
+session = None
+session_lock = threading.Lock()
+
+def http_session():
+    # one keep-alive session shared by all fetch threads
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=tile_fetch_workers)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        return session
+
+store = None
+store_lock = threading.Lock()
+
+def tile_store():
+    # opened on first use so spawned workers get their own connection
+    global store
+    with store_lock:
+        if store is None:
+            store = TileStore(cache, cache_max_bytes)
+        return store
+
+def download_tile(z, x, y):
     url = tile_url.format(z=z, x=x, y=y)
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_session().get(url, timeout=10)
         resp.raise_for_status()
         data = resp.content
-
-        # save to cache
-        with open(cache_path, "wb") as f:
-            f.write(data)
-
+        tile_store().put(z, x, y, data)
         return data
     except Exception as e:
         # oopsie daisy
         return None
 
 
-@lru_cache(maxsize=4096)
+class ByteCache:
+    # lru bounded by the total size of its values rather than their count
+    def __init__(self, budget, sizeof=len):
+        self.budget = budget
+        self.sizeof = sizeof
+        self.items = OrderedDict()  # {key: (value, size)}, oldest first
+        self.bytes_used = 0
+        self.lock = threading.Lock()
+
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self.lock:
+            self.discard_locked(key)
+            if size > self.budget: return
+            self.items[key] = (value, size)
+            self.bytes_used += size
+            while self.bytes_used > self.budget:
+                _, (_, old) = self.items.popitem(last=False)
+                self.bytes_used -= old
+                self.evictions += 1
+
+    def discard(self, key):
+        with self.lock:
+            self.discard_locked(key)
+
+    def discard_locked(self, key):
+        item = self.items.pop(key, None)
+        if item: self.bytes_used -= item[1]
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.bytes_used = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.items),
+                'bytes': self.bytes_used,
+                'budget': self.budget,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+raw_cache = ByteCache(raw_cache_budget)
+
+def fetch_tile_raw(z, x, y):
+    # memory, then the store, then the network
+    data = raw_cache.get((z, x, y))
+    if data is None:
+        # b"" is a real (empty) tile, only None means we have nothing
+        data = tile_store().get(z, x, y)
+        if data is None: data = download_tile(z, x, y)
+        if data is not None: raw_cache.put((z, x, y), data)
+    return data
+
 def decode_mvt(z, x, y):
+    # None when the tile couldnt be fetched or decoded, {} when it
+    # just has nothing in it (open ocean etc)
     raw = fetch_tile_raw(z, x, y)
-    if not raw:
+    if raw is None:
         return None
 
+    # imported here, it drags shapely in for its encoder
+    import mapbox_vector_tile
     try:
-        return mapbox_vector_tile.decode(raw)
+        # drop the layers nobody reads before decoding
+        data = mapbox_vector_tile.decoder.TileData(raw)
+        layers = data.tile.layers
+        for i in reversed(range(len(layers))):
+            if layers[i].name not in used_layers: del layers[i]
+        return data.get_message()
     except Exception as e:
         # print("decode error:", e)
         return None
 
+def forget_tile(z, x, y):
+    # the tile is processed, nothing needs its raw bytes in memory anymore
+    raw_cache.discard((z, x, y))
+
+def cache_stats():
+    return {'raw': raw_cache.stats(), 'store': tile_store().stats()}
+
 def fetch_and_decode_tile(z, x, y):
     # wrapper
     return decode_mvt(z, x, y)
@@ -97,8 +206,7 @@ def fetch_vector_tile_features(bbox_lonlat, screen_zoom):
     # fetch tile features
     lon_min, lat_min, lon_max, lat_max = bbox_lonlat
 
-    # map screen zoom to tile zoom
-    tile_z = int(min(max(4, round(math.log2(screen_zoom + 1) + 5)), 16))
+    tile_z = tile_zoom_for(screen_zoom)
     tiles = tiles_for_bbox(lon_min, lat_min, lon_max, lat_max, tile_z)
 
     out = []
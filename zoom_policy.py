@@ -0,0 +1,57 @@
+import math
+
+# which vector tile zoom to fetch for a screen zoom. screen zoom is braille
+# pixels per mercator degree / 4 (see BrailleBuffer.draw_polyline), so
+# a z tile spans 360 / 2**z degrees = 360 / 2**z * zoom * 4 pixels
+
+# tile zooms we fetch, screen zooms in between use the next more detailed one
+tile_levels = (8, 12, 14)
+
+# a tile stops being detailed enough once it covers more braille pixels
+# than this. 512 puts the 8 -> 12 -> 14 switches at screen zoom ~90 and
+# ~1450, about where main.py always had them
+target_tile_px = 512
+
+# how far (in tile zoom levels) past a switch point the view has to go
+# before we actually switch, 0.35 is about 1.3x in screen zoom
+hysteresis = 0.35
+
+def pixels_per_degree(zoom, aspect_ratio=2.0):
+    # the denser of the two axes
+    return zoom * max(4.0, aspect_ratio * 2.0)
+
+def ideal_tile_zoom(zoom, aspect_ratio=2.0):
+    # fractional tile zoom where one tile covers target_tile_px pixels
+    return math.log2(max(360.0 * pixels_per_degree(zoom, aspect_ratio) / target_tile_px, 1e-9))
+
+def level_for(ideal, levels=tile_levels):
+    # smallest level at least as detailed as ideal, clamped to the range
+    for level in levels:
+        if level >= ideal: return level
+    return levels[-1]
+
+def tile_zoom_for(zoom, aspect_ratio=2.0, levels=tile_levels):
+    # stateless version for one off lookups
+    return level_for(ideal_tile_zoom(zoom, aspect_ratio), levels)
+
+class TileZoomPolicy:
+    # tile_zoom_for plus memory: only switch levels once the view is
+    # clearly past a switch point, so zooming back and forth over one
+    # doesnt throw away and refetch the whole tile set each time
+    def __init__(self, levels=tile_levels, margin=hysteresis):
+        self.levels = levels
+        self.margin = margin
+        self.current = None
+        self.switches = 0
+
+    def update(self, zoom, aspect_ratio=2.0):
+        ideal = ideal_tile_zoom(zoom, aspect_ratio)
+        level = level_for(ideal, self.levels)
+        if self.current is not None and level != self.current:
+            # only move if we'd still pick that side with the margin applied
+            nudged = ideal - self.margin if level > self.current else ideal + self.margin
+            if level_for(nudged, self.levels) == self.current: level = self.current
+        if level != self.current:
+            if self.current is not None: self.switches += 1
+            self.current = level
+        return level